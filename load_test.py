@@ -0,0 +1,228 @@
+"""Parallel-session load test for the PMTCT Streamlit app.
+
+Drives pmtct_dashboard.main() headlessly with Streamlit's app-testing API.
+Each simulated session uploads a synthetic dataset, changes filters, drills
+down, switches to comparison mode and reruns the export. The test reports
+p50/p95 rerun latency per step and peak memory per session:
+
+    python load_test.py --sessions 8 --facilities 2000 --months 12
+    python load_test.py --sessions 16 --max-p95 5
+
+Every session runs in its own process, all at once, because the app-testing
+API keeps process-wide state for the duration of each run. What is measured
+is therefore each session's cold-cache latency while the sessions compete for
+CPU, memory and disk. Nothing a single Streamlit server shares between its
+sessions is exercised: not the precompute pool, the result cache and its
+waits for a result another session is computing, the GIL, or st.cache_*. It
+is not a test of how one server degrades under concurrent users.
+
+A non-zero exit status means a session failed or a p95 latency exceeded
+--max-p95.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pmtct_core import INDICATOR_COLUMNS, REPORTING_RATE_COLUMNS
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs the real app, with the file uploader returning this session's synthetic upload
+APP_SCRIPT = textwrap.dedent(f'''
+    import io
+    import sys
+    sys.path.insert(0, {APP_DIR!r})
+    import streamlit as st
+
+    def load_test_upload(*args, **kwargs):
+        path = st.session_state.get('load_test_csv')
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            upload = io.BytesIO(f.read())
+        upload.name = path
+        return upload
+
+    st.sidebar.file_uploader = load_test_upload
+    import pmtct_dashboard
+    pmtct_dashboard.main()
+''')
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June',
+          'July', 'August', 'September', 'October', 'November', 'December']
+
+STEPS = ['upload', 'filter_states', 'filter_months', 'drilldown', 'comparison', 'export']
+
+
+def make_synthetic_dataset(facilities=2000, months=12, states=37, lgas=774, seed=0):
+    """NDARS-shaped data with one row per facility and month"""
+    rng = np.random.default_rng(seed)
+    periods = [f"{MONTHS[i % 12]} {2024 + i // 12}" for i in range(months)]
+
+    facility_ids = np.arange(facilities)
+    lga_ids = facility_ids % lgas
+    rows = len(periods) * facilities
+    data = pd.DataFrame({
+        'periodname': np.repeat(periods, facilities),
+        'orgunitlevel1': np.tile([f"State {lga % states}" for lga in lga_ids], len(periods)),
+        'orgunitlevel2': np.tile([f"LGA {lga}" for lga in lga_ids], len(periods)),
+        'orgunitlevel3': np.tile([f"Facility {i}" for i in facility_ids], len(periods)),
+    })
+    data['organisationunitname'] = data['orgunitlevel3']
+
+    for col in INDICATOR_COLUMNS:
+        if col not in REPORTING_RATE_COLUMNS:
+            data[col] = rng.poisson(20, rows)
+    for col in REPORTING_RATE_COLUMNS:
+        data[col] = rng.choice([0, 100], rows, p=[0.1, 0.9])
+    return data
+
+
+def find_widget(widgets, label):
+    """First widget with the given label"""
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def run_session(csv_path, seed):
+    """Play one user's session and return (step, seconds) pairs and any errors"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng(seed)
+    app = AppTest.from_string(APP_SCRIPT, default_timeout=600)
+    app.session_state['load_test_csv'] = csv_path
+    timings = []
+    errors = []
+
+    def timed(step, action):
+        start = time.perf_counter()
+        action()
+        timings.append((step, time.perf_counter() - start))
+        errors.extend(f"{step}: {exception.value}" for exception in app.exception)
+
+    timed('upload', app.run)
+    if errors:
+        return timings, errors
+
+    states = find_widget(app.multiselect, "Select State(s)")
+    picked_states = list(rng.choice(states.options, size=max(1, len(states.options) // 4), replace=False))
+    timed('filter_states', lambda: states.set_value(picked_states).run())
+
+    months = find_widget(app.multiselect, "Select Month(s)")
+    picked_months = months.options[:max(1, len(months.options) // 3)]
+    timed('filter_months', lambda: months.set_value(picked_months).run())
+
+    # Same state a bar click on the drill-down chart would leave behind
+    def drill():
+        app.session_state['drill_path'] = [picked_states[0]]
+        app.run()
+    timed('drilldown', drill)
+
+    comparison = find_widget(app.checkbox, "Compare two selections")
+    timed('comparison', lambda: comparison.check().run())
+
+    # Back to the full dataset, whose CSV export is the largest the app builds
+    def export():
+        find_widget(app.checkbox, "Compare two selections").uncheck().run()
+        find_widget(app.multiselect, "Select State(s)").set_value(states.options)
+        find_widget(app.multiselect, "Select Month(s)").set_value(months.options).run()
+    timed('export', export)
+
+    return timings, errors
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_process(csv_path, seed):
+    """Run one session in this process and report the process's peak memory"""
+    return os.getpid(), run_session(csv_path, seed), peak_memory_mb()
+
+
+def summarize(timings):
+    """p50, p95 and max latency per step, in seconds"""
+    frame = pd.DataFrame(timings, columns=['step', 'seconds'])
+    summary = frame.groupby('step')['seconds'].agg(
+        sessions='count',
+        p50=lambda s: np.percentile(s, 50),
+        p95=lambda s: np.percentile(s, 95),
+        max='max'
+    ).reindex([step for step in STEPS if step in set(frame['step'])])
+    summary.loc['all reruns'] = [len(frame), np.percentile(frame['seconds'], 50),
+                                 np.percentile(frame['seconds'], 95), frame['seconds'].max()]
+    summary['sessions'] = summary['sessions'].astype(int)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the PMTCT dashboard with sessions in parallel processes")
+    parser.add_argument('--sessions', type=int, default=8, help="Sessions run at once, one process each")
+    parser.add_argument('--facilities', type=int, default=2000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-p95', type=float,
+                        help="Fail if any step's p95 latency exceeds this many seconds with cold caches")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'synthetic_pmtct.csv')
+        data = make_synthetic_dataset(args.facilities, args.months, seed=args.seed)
+        data.to_csv(csv_path, index=False)
+        print(f"Synthetic dataset: {len(data):,} rows, {len(data.columns)} columns, "
+              f"{os.path.getsize(csv_path) / 1e6:.1f} MB")
+        del data
+
+        print(f"Running {args.sessions} session(s), one process each, with cold caches...")
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.sessions) as pool:
+            processes = list(pool.map(run_process, [csv_path] * args.sessions,
+                                      range(args.seed, args.seed + args.sessions)))
+        elapsed = time.perf_counter() - start
+
+    timings = [timing for _, (session, _), _ in processes for timing in session]
+    errors = [error for _, (_, session), _ in processes for error in session]
+
+    print(f"\nCompleted in {elapsed:.1f}s")
+    print("Sessions ran in separate processes: this measures CPU contention, not the caches, "
+          "worker pool or GIL shared inside one Streamlit server.\n")
+    print("Rerun latency (seconds):")
+    print(summarize(timings).round(3).to_string())
+
+    print("\nPeak memory per session process:")
+    for pid, _, memory in processes:
+        print(f"  pid {pid}: " + (f"{memory:,.0f} MB" if memory is not None else "not available on this platform"))
+
+    failed = False
+    if errors:
+        failed = True
+        print(f"\n{len(errors)} error(s):")
+        for error in errors[:20]:
+            print(f"  {error}")
+    if args.max_p95 is not None:
+        slow = summarize(timings).query('p95 > @args.max_p95')
+        if not slow.empty:
+            failed = True
+            print(f"\nSteps over the {args.max_p95}s p95 budget: {', '.join(slow.index)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
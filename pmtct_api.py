@@ -0,0 +1,174 @@
+"""Local JSON API serving PMTCT indicator totals and coverage ratios.
+
+Run alongside (or instead of) the Streamlit app:
+
+    python pmtct_api.py path/to/pmtct_data.csv --port 8502
+
+The data can also be a ZIP of per-state extracts or a folder of them.
+
+Endpoints:
+    GET /api/kpis     totals, average reporting rates and ratios for the filtered data
+    GET /api/filters  values available for each filter
+
+Filters are repeatable query parameters, e.g.
+/api/kpis?period=January%202024&state=Lagos&state=Kano
+Responses carry an ETag derived from the dataset fingerprint and the filter,
+so clients polling with If-None-Match get a 304 without any recomputation.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from pmtct_core import (
+    PMTCTDashboard, FILTER_PARAMS, RESULT_CACHE, canonical_filter_key, dataset_fingerprint, read_dataset
+)
+
+
+class DatasetUnavailable(Exception):
+    """The dataset cannot be read and no earlier copy of it is loaded"""
+
+
+class DatasetSource:
+    """Dataset loaded from disk, reloaded when the file changes"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.dashboard = None
+        self.cube = None
+        self.fingerprint = None
+    
+    def load(self):
+        """Return the current dashboard, aggregate cube and fingerprint.
+        
+        While the file is missing, or half-written and unreadable, the last loaded
+        copy keeps being served; DatasetUnavailable is raised only if there is none.
+        A failed reload is retried on the next request.
+        """
+        with self.lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime != self.mtime:
+                    dashboard = PMTCTDashboard(read_dataset(self.path), clean=False)
+                    cube = dashboard.build_aggregate_cube()
+                    fingerprint = dataset_fingerprint(dashboard.data)
+                    self.dashboard, self.cube, self.fingerprint, self.mtime = dashboard, cube, fingerprint, mtime
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                if self.dashboard is None:
+                    raise DatasetUnavailable(f"Dataset not available: {e}") from e
+            return self.dashboard, self.cube, self.fingerprint
+
+
+def parse_selection(query):
+    """Turn query parameters into a column -> values selection"""
+    params = parse_qs(query)
+    unknown = sorted(set(params) - set(FILTER_PARAMS))
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(unknown)}. Use: {', '.join(FILTER_PARAMS)}")
+    return {col: params.get(param, []) for param, col in FILTER_PARAMS.items()}
+
+
+def make_etag(fingerprint, filter_key):
+    """Strong ETag for one dataset and filter combination"""
+    return f'"{fingerprint}-{hashlib.sha1(filter_key.encode("utf-8")).hexdigest()[:16]}"'
+
+
+class KPIRequestHandler(BaseHTTPRequestHandler):
+    source = None
+    
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path == '/api/kpis':
+                self.serve_kpis(url.query)
+            elif url.path == '/api/filters':
+                self.serve_filters()
+            else:
+                self.send_json(404, {'error': f"Not found: {url.path}"})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except DatasetUnavailable as e:
+            self.send_json(503, {'error': str(e)})
+    
+    def serve_kpis(self, query):
+        """Totals and ratios for the requested filter, answered from the ETag or cache where possible"""
+        selection = parse_selection(query)
+        dashboard, cube, fingerprint = self.source.load()
+        filter_key = canonical_filter_key(selection)
+        etag = make_etag(fingerprint, filter_key)
+        
+        if self.send_not_modified(etag):
+            return
+        
+        summary = RESULT_CACHE.get_or_compute(
+            ('kpis', fingerprint, filter_key),
+            lambda: dashboard.summarize_selection(cube, selection)
+        )
+        # Echo the filter under the request's parameter names, not the data's column names
+        columns = json.loads(filter_key)
+        filters = {param: columns[col] for param, col in FILTER_PARAMS.items() if col in columns}
+        body = {'dataset': fingerprint, 'filters': filters, **summary}
+        self.send_json(200, body, etag)
+    
+    def serve_filters(self):
+        """Values available for each filter parameter"""
+        _, cube, fingerprint = self.source.load()
+        etag = make_etag(fingerprint, '')
+        if self.send_not_modified(etag):
+            return
+        
+        filters = RESULT_CACHE.get_or_compute(
+            ('filters', fingerprint),
+            lambda: {param: sorted(map(str, cube[col].dropna().unique()))
+                     for param, col in FILTER_PARAMS.items() if col in cube.columns}
+        )
+        self.send_json(200, {'dataset': fingerprint, 'filters': filters}, etag)
+    
+    def send_not_modified(self, etag):
+        """Answer 304 if the client already holds this ETag"""
+        if etag not in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+    
+    def send_json(self, status, body, etag=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PMTCT KPI aggregates as JSON")
+    parser.add_argument('data', help="PMTCT data CSV exported from NDARS, or a ZIP or folder of extracts")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+    
+    KPIRequestHandler.source = DatasetSource(args.data)
+    KPIRequestHandler.source.load()
+    
+    server = ThreadingHTTPServer((args.host, args.port), KPIRequestHandler)
+    print(f"Serving PMTCT KPIs on http://{args.host}:{args.port}/api/kpis")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2437 @@
+"""Calculation core of the PMTCT dashboard.
+
+Cleaning, indicator sums and ratios, period parsing, aggregation and ingestion,
+importable without Streamlit. Plotly is imported only when a chart is built.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import OrderedDict
+import csv
+from datetime import datetime
+import difflib
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# Period and org unit columns that are never converted to numbers
+DIMENSION_COLUMNS = ['periodname', 'orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3',
+                     'organisationunitname', 'organisationunitcode', 'perioddescription',
+                     'periodid', 'periodcode']
+
+# Columns the aggregate cube is grouped by, from coarsest to finest
+CUBE_DIMENSIONS = ['periodname', 'orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3']
+
+# Org unit hierarchy below national level, with display names
+ORG_UNIT_LEVELS = {
+    'orgunitlevel1': 'State',
+    'orgunitlevel2': 'LGA',
+    'orgunitlevel3': 'Facility',
+}
+
+# Coverage indicators as (numerator columns, denominator columns); each side is summed
+INDICATOR_RATIOS = {
+    'ANC HIV Testing': (
+        ['PMTCT_HTS_6 Number of  pregnant women HIV tested and received results ANC'],
+        ['PMTCT_ANC_1 Number of New ANC clients']
+    ),
+    'L&D HIV Testing': (
+        ['PMTCT_HTS_6 Number of  pregnant women HIV tested and received results L&D'],
+        ['PMTCT_ANC_1 Number of New ANC clients']
+    ),
+    'HBV Testing': (
+        ['PMTCT_HTS_10. Number of new ANC Clients tested for HBV ( ANC, L&D, <72hrs Post Partum)'],
+        ['PMTCT_ANC_1 Number of New ANC clients']
+    ),
+    'HCV Testing': (
+        ['PMTCT_HTS_11. Number of new ANC Clients tested for HCV ( ANC, L&D, <72hrs Post Partum)'],
+        ['PMTCT_ANC_1 Number of New ANC clients']
+    ),
+    'EID Coverage': (
+        ['PMTCT_EID_33. No. of of HEI whose samples were taken within 2 months of birth for DNA PCR'],
+        ['PMTCT_HTS_7. Number of pregnant women tested HIV positive_ ANC',
+         'PMTCT_HTS_7. Number of pregnant women tested HIV positive_ L&D',
+         'PMTCT_HTS_5. Number of pregnant women with previously known HIV positive infection']
+    ),
+    'ANC ART Coverage': (
+        ['PMTCT_ART_15b. Number of HIV positive pregnant women newly started on  ART during ANC  <36wks of pregnancy',
+         'PMTCT_ART_15c. Number of HIV positive pregnant women newly started on  ART during ANC >36wks of pregnancy'],
+        ['PMTCT_HTS_7. Number of pregnant women tested HIV positive_ ANC']
+    ),
+    'L&D ART Coverage': (
+        ['PMTCT_ART_15d. Number of HIV positive pregnant women newly started on  ART during Labour'],
+        ['PMTCT_HTS_7. Number of pregnant women tested HIV positive_ L&D']
+    ),
+    'Known HIV+ on ART': (
+        ['PMTCT_ART_15a. Number of HIV positive pregnant women already on ART prior to this pregnancy'],
+        ['PMTCT_HTS_5. Number of pregnant women with previously known HIV positive infection']
+    ),
+    'Syphilis Testing': (
+        ['PMTCT_ANC_2. Number of new ANC Clients tested for syphilis total'],
+        ['PMTCT_ANC_1 Number of New ANC clients']
+    ),
+    'Syphilis Treatment': (
+        ['PMTCT_ANC_4. Number of the ANC Clients treated for Syphilis total'],
+        ['PMTCT_ANC_3. Number of new ANC Clients tested positive for syphilis Total']
+    ),
+    'HIV+ Delivery Coverage': (
+        ['PMTCT_L&D_21. Number of booked HIV positive pregnant women who delivered at facility'],
+        ['PMTCT_L&D_20. Total deliveries at facility (booked and unbooked pregnant women)']
+    ),
+    'Hub Referral Completion': (
+        ['PMTCT_ADDENDUM_15h Number of HIV positive pregnant women  identified in the spoke site who were initiated on ART in the comprehensive site'],
+        ['PMTCT_ART_15h. Number of Pregnant women referred to a Hub facility for treatment']
+    ),
+}
+
+# Reporting rate columns averaged per period: column -> (label, line colour)
+REPORTING_RATE_COLUMNS = {
+    'PMTCT MSF Comprehensive - Reporting rate': ('Comprehensive Sites', '#008751'),
+    'PMTCT MSF FOR SPOKE SITES   - Reporting rate': ('Spoke Sites', '#FFD700'),
+}
+
+# Columns charted by PMTCTDashboard that are not part of any coverage ratio
+CHART_ONLY_COLUMNS = [
+    'PMTCT_ART_15e. Number of HIV positive pregnant women newly started on  ART during Post Partum (<72 hrs)',
+    'PMTCT_EID_33. No. of HIV PCR results received for babies whose samples were taken for DNA PCR_Negative',
+    'PMTCT_EID_33. No. of HIV PCR results received for babies whose samples were taken for DNA PCR_Positive',
+]
+
+# Every indicator column the dashboard reads
+INDICATOR_COLUMNS = list(dict.fromkeys(
+    [col for numerator_cols, denominator_cols in INDICATOR_RATIOS.values() for col in denominator_cols + numerator_cols]
+    + CHART_ONLY_COLUMNS
+    + list(REPORTING_RATE_COLUMNS)
+))
+
+# Rows read to check a file's schema before parsing all of it
+SCHEMA_SAMPLE_ROWS = 50
+
+# Org unit columns filled from the top of a DHIS2 org unit path, coarsest first
+DHIS2_ORG_UNIT_COLUMNS = ['orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3']
+
+# Levels at the top of a DHIS2 org unit path with no column of their own (the national root)
+DHIS2_ROOT_LEVELS = 1
+
+# Fields every dataValueSets value needs
+DHIS2_DATA_VALUE_FIELDS = ['dataElement', 'period', 'orgUnit', 'value']
+
+# Short filter names used in query strings, mapped to the columns they filter
+FILTER_PARAMS = {
+    'period': 'periodname',
+    'state': 'orgunitlevel1',
+    'lga': 'orgunitlevel2',
+    'facility': 'orgunitlevel3',
+}
+
+# Prefix for query parameters that list the values dropped from a filter
+EXCLUDE_PARAM_PREFIX = 'not_'
+
+# Memory budget of the process-wide result cache, in MB
+RESULT_CACHE_MB = int(os.environ.get('PMTCT_RESULT_CACHE_MB', 512))
+
+# Ratios shown in the KPI strip at the top of the page
+KPI_STRIP = ['ANC HIV Testing', 'L&D HIV Testing', 'HBV Testing', 'HCV Testing', 'EID Coverage']
+
+# Cascades whose numerator happens weeks after its denominator, compared across
+# months: name -> (numerator columns, denominator columns), each side summed
+LAGGED_RATIOS = {
+    'EID Samples vs HIV+ Deliveries': (
+        ['PMTCT_EID_33. No. of of HEI whose samples were taken within 2 months of birth for DNA PCR'],
+        ['PMTCT_L&D_21. Number of booked HIV positive pregnant women who delivered at facility']
+    ),
+    'EID Coverage': INDICATOR_RATIOS['EID Coverage'],
+    'ANC ART Coverage': INDICATOR_RATIOS['ANC ART Coverage'],
+    'L&D ART Coverage': INDICATOR_RATIOS['L&D ART Coverage'],
+}
+
+# Most facility points sent to the browser in one scatter; denser data is binned
+MAX_SCATTER_POINTS = 5000
+
+# Width of the coverage histogram bins, in percentage points
+HISTOGRAM_BIN_WIDTH = 5
+
+# Local boundary files for the map, one GeoJSON file per org unit level
+BOUNDARY_DIR = os.environ.get('PMTCT_BOUNDARY_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'boundaries'))
+# Folder the app may read extract folders from, set by the operator; unset hides the folder input
+EXTRACT_ROOT = os.environ.get('PMTCT_EXTRACT_ROOT')
+
+BOUNDARY_FILES = {
+    'orgunitlevel1': 'nigeria_states.geojson',
+    'orgunitlevel2': 'nigeria_lgas.geojson',
+}
+
+# Feature properties holding area names in common Nigeria boundary sets (GRID3, OCHA, geoBoundaries)
+BOUNDARY_NAME_PROPERTIES = {
+    'orgunitlevel1': ['statename', 'state_name', 'admin1Name_en', 'ADM1_EN', 'NAME_1', 'shapeName', 'name'],
+    'orgunitlevel2': ['lganame', 'lga_name', 'admin2Name_en', 'ADM2_EN', 'NAME_2', 'shapeName', 'name'],
+}
+BOUNDARY_PARENT_PROPERTIES = ['statename', 'state_name', 'admin1Name_en', 'ADM1_EN', 'NAME_1']
+
+# Names spelled differently between NDARS and boundary files, after normalization
+BOUNDARY_NAME_ALIASES = {
+    'fct': 'federal capital territory',
+    'abuja': 'federal capital territory',
+    'abuja federal capital territory': 'federal capital territory',
+    'nassarawa': 'nasarawa',
+}
+
+# Words that tell apart neighbouring areas (Ilorin East and West); spelling matches never cross them
+BOUNDARY_DIRECTION_WORDS = {'north', 'south', 'east', 'west', 'central'}
+
+# Least similarity for matching an org unit name to a differently spelled boundary name
+BOUNDARY_MATCH_CUTOFF = 0.85
+
+# Coordinates are snapped to this many decimal places (about 1 m) so shared borders match exactly
+BOUNDARY_PRECISION = 5
+
+# Simplification tolerance in degrees for each map zoom level
+MAP_ZOOM_TOLERANCES = {
+    'national': 0.01,
+    'state': 0.002,
+}
+
+# The map switches to the detailed zoom when this many states or fewer are selected
+MAP_DETAIL_STATES = 3
+
+# Consecutive missed periods after which a facility is flagged
+MISSING_STREAK_ALERT = 3
+
+# Most facilities drawn in the completeness heatmap, least complete first
+MAX_HEATMAP_FACILITIES = 200
+
+# Cascade charts in page order: name -> (section heading, PMTCTDashboard method, arguments)
+CASCADE_CHARTS = {
+    'anc_testing': ("NEW ANC VISIT VS HIV TESTING", 'create_anc_hiv_testing_chart', ()),
+    'anc_treatment': ("TESTED POSITIVE VERSUS STARTED ON TREATMENT ANC", 'create_anc_treatment_cascade', ()),
+    'ld_cascade': ("LABOUR AND DELIVERY POSITIVE VERSUS TREATMENT", 'create_ld_cascade', ()),
+    'previously_known': ("PREVIOUSLY KNOWN ON ART", 'create_previously_known_chart', ()),
+    'comprehensive_art': ("COMPREHENSIVE ART INITIATION OVERVIEW", 'create_comprehensive_art_chart', ()),
+    'hbv': ("VIRAL HEPATITIS TESTING B (HBV)", 'create_comparison_chart', (
+        "HBV Testing Coverage",
+        'PMTCT_HTS_10. Number of new ANC Clients tested for HBV ( ANC, L&D, <72hrs Post Partum)',
+        'PMTCT_ANC_1 Number of New ANC clients',
+        "HBV Tested", "ANC Clients"
+    )),
+    'hcv': ("VIRAL HEPATITIS TESTING C (HCV)", 'create_comparison_chart', (
+        "HCV Testing Coverage",
+        'PMTCT_HTS_11. Number of new ANC Clients tested for HCV ( ANC, L&D, <72hrs Post Partum)',
+        'PMTCT_ANC_1 Number of New ANC clients',
+        "HCV Tested", "ANC Clients"
+    )),
+    'syphilis_test': ("SYPHILLIS TESTING", 'create_comparison_chart', (
+        "Syphilis Testing Coverage",
+        'PMTCT_ANC_2. Number of new ANC Clients tested for syphilis total',
+        'PMTCT_ANC_1 Number of New ANC clients',
+        "Syphilis Tested", "ANC Clients"
+    )),
+    'syphilis_treat': ("SYPHILLIS TREATMENT", 'create_comparison_chart', (
+        "Syphilis Treatment Coverage",
+        'PMTCT_ANC_4. Number of the ANC Clients treated for Syphilis total',
+        'PMTCT_ANC_3. Number of new ANC Clients tested positive for syphilis Total',
+        "Treated", "Syphilis Positive"
+    )),
+    'delivery': ("DELIVERY CASCADE", 'create_comparison_chart', (
+        "Delivery Coverage for HIV+ Women",
+        'PMTCT_L&D_21. Number of booked HIV positive pregnant women who delivered at facility',
+        'PMTCT_L&D_20. Total deliveries at facility (booked and unbooked pregnant women)',
+        "HIV+ Deliveries", "Total Deliveries"
+    )),
+    'eid': ("EID SAMPLE COLLECTION & RESULTS", 'create_eid_chart', ()),
+    'referral': ("HUB & SPOKE REFERRAL SYSTEM", 'create_hub_spoke_referral', ()),
+}
+
+class PMTCTDashboard:
+    def __init__(self, data, clean=True):
+        self.data = data
+        if clean:
+            self.clean_data()
+    
+    def clean_data(self):
+        """Clean and preprocess the data"""
+        # Replace empty strings with NaN
+        self.data = self.data.replace('', np.nan)
+        
+        # Convert all columns to numeric where possible
+        for col in self.data.columns:
+            if col not in DIMENSION_COLUMNS:
+                self.data[col] = pd.to_numeric(self.data[col], errors='coerce').fillna(0)
+    
+    def safe_sum(self, column_name):
+        """Safely sum a column, returning 0 if column doesn't exist"""
+        if column_name in self.data.columns:
+            return self.data[column_name].sum()
+        return 0
+    
+    def calculate_percentage(self, numerator, denominator):
+        """Calculate percentage safely"""
+        if denominator > 0:
+            return (numerator / denominator) * 100
+        return 0
+    
+    def indicator_columns(self):
+        """Numeric indicator columns, excluding period and org unit columns"""
+        return [col for col in self.data.columns
+                if col not in DIMENSION_COLUMNS and pd.api.types.is_numeric_dtype(self.data[col])]
+    
+    def indicator_totals(self):
+        """Sum every indicator column in a single pass"""
+        return self.data[self.indicator_columns()].sum()
+    
+    def compute_ratios(self, totals, names=None):
+        """Calculate coverage percentages for the named ratios from indicator totals"""
+        ratios = {}
+        for name in (names or INDICATOR_RATIOS):
+            numerator_cols, denominator_cols = INDICATOR_RATIOS[name]
+            numerator = sum(totals.get(col, 0) for col in numerator_cols)
+            denominator = sum(totals.get(col, 0) for col in denominator_cols)
+            ratios[name] = self.calculate_percentage(numerator, denominator)
+        return ratios
+    
+    def build_aggregate_cube(self):
+        """Sum indicators per period and org unit, with the number of source records"""
+        dimensions = [col for col in CUBE_DIMENSIONS if col in self.data.columns]
+        indicators = self.indicator_columns()
+        if not dimensions:
+            cube = self.data[indicators].sum().to_frame().T
+            cube['record_count'] = len(self.data)
+            return cube
+        
+        grouped = self.data.groupby(dimensions, sort=False, dropna=False)
+        cube = grouped[indicators].sum()
+        cube['record_count'] = grouped.size()
+        return cube.reset_index()
+    
+    def build_trend_matrix(self, cube):
+        """Indicator totals per period (periods x indicators) from the aggregate cube"""
+        if 'periodname' not in cube.columns:
+            return None
+        other_dimensions = [col for col in CUBE_DIMENSIONS if col in cube.columns and col != 'periodname']
+        matrix = cube.drop(columns=other_dimensions).groupby('periodname', sort=False).sum()
+        matrix = matrix.iloc[calendar_order(matrix.index)]
+        
+        # Reporting rates are percentages: average them over the period's records
+        reporting_cols = [col for col in REPORTING_RATE_COLUMNS if col in matrix.columns]
+        if reporting_cols and 'record_count' in matrix.columns:
+            matrix[reporting_cols] = matrix[reporting_cols].div(matrix['record_count'].where(matrix['record_count'] > 0), axis=0)
+        return matrix
+    
+    def build_league_table(self, cube, level='orgunitlevel1'):
+        """Rank org units at the given level by their coverage ratios"""
+        if level not in cube.columns:
+            return None
+        other_dimensions = [col for col in CUBE_DIMENSIONS if col in cube.columns and col != level]
+        totals = cube.drop(columns=other_dimensions).groupby(level).sum()
+        
+        league = compute_ratio_frame(totals).round(1)
+        league = league.sort_values('ANC HIV Testing', ascending=False)
+        league.insert(0, 'Rank', range(1, len(league) + 1))
+        return league
+    
+    def create_drilldown_chart(self, ratios, indicator, level_label, parent_label):
+        """Create a bar chart of one coverage ratio across the org units below a node"""
+        import plotly.graph_objects as go
+        
+        ratios = ratios.sort_values(ascending=False)
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Bar(
+            x=[str(name) for name in ratios.index],
+            y=ratios.values,
+            marker_color=['#008751' if val >= 90 else '#ffc107' if val >= 70 else '#dc3545' for val in ratios.values],
+            text=[f'{val:.1f}%' for val in ratios.values],
+            textposition='auto',
+            textfont=dict(size=16, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>{indicator} by {level_label}</b><br><sub>{parent_label} | Click a bar to drill down</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=14, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            ),
+            yaxis=dict(
+                title="Coverage (%)",
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            )
+        )
+        
+        return fig
+    
+    def create_facility_scatter(self, points, ratio_name, volume_label, total_facilities):
+        """Create a WebGL scatter of facility coverage against volume from binned points"""
+        import plotly.graph_objects as go
+        
+        binned = points['facilities'] > 1
+        hover = [f"{count:,} facilities near here" if count > 1 else name
+                 for name, count in zip(points['name'], points['facilities'])]
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Scattergl(
+            x=points['volume'],
+            y=points['coverage'],
+            mode='markers',
+            marker=dict(
+                size=np.where(binned, 6 + 3 * np.log2(points['facilities'].clip(lower=1)), 6),
+                color=np.where(points['coverage'] >= 90, '#008751', np.where(points['coverage'] >= 70, '#ffc107', '#dc3545')),
+                opacity=0.7
+            ),
+            text=hover,
+            hovertemplate="%{text}<br>Volume: %{x:,.0f}<br>Coverage: %{y:.1f}%<extra></extra>"
+        ))
+        
+        fig.add_hline(y=90, line_dash="dash", line_color="red", annotation_text="90% Target")
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>{ratio_name} vs {volume_label}</b><br><sub>{total_facilities:,} facilities, {len(points):,} points plotted</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=550,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                title=f"{volume_label} (log scale)",
+                type='log',
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            ),
+            yaxis=dict(
+                title="Coverage (%)",
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            )
+        )
+        
+        return fig
+    
+    def create_coverage_histogram(self, counts, edges, ratio_name):
+        """Create a histogram of facility coverage from precomputed bin counts"""
+        import plotly.graph_objects as go
+        
+        labels = [f"{low:.0f}-{high:.0f}%" for low, high in zip(edges[:-1], edges[1:])]
+        labels[-1] = f"≥{edges[-2]:.0f}%"
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Bar(
+            x=labels,
+            y=counts,
+            marker_color=['#008751' if low >= 90 else '#ffc107' if low >= 70 else '#dc3545' for low in edges[:-1]]
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>Facility Distribution</b><br><sub>{ratio_name}</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            bargap=0.05,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                title="Coverage (%)",
+                tickfont=dict(size=12, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            ),
+            yaxis=dict(
+                title="Facilities",
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            )
+        )
+        
+        return fig
+    
+    def create_coverage_box(self, stats, ratio_name, level_label):
+        """Create box plots of facility coverage per org unit from precomputed quartiles"""
+        import plotly.graph_objects as go
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Box(
+            x=[str(name) for name in stats.index],
+            q1=stats['q1'],
+            median=stats['median'],
+            q3=stats['q3'],
+            lowerfence=stats['lowerfence'],
+            upperfence=stats['upperfence'],
+            marker_color='#008751',
+            boxpoints=False
+        ))
+        
+        fig.add_hline(y=90, line_dash="dash", line_color="red", annotation_text="90% Target")
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>Facility Spread by {level_label}</b><br><sub>{ratio_name}</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=12, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            ),
+            yaxis=dict(
+                title="Coverage (%)",
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            )
+        )
+        
+        return fig
+    
+    def create_choropleth_map(self, geojson, feature_ids, values, area_names, ratio_name, level_label):
+        """Create a choropleth of one coverage ratio from pre-simplified boundaries"""
+        import plotly.graph_objects as go
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Choropleth(
+            geojson=geojson,
+            locations=feature_ids,
+            z=values,
+            text=area_names,
+            zmin=0,
+            zmax=100,
+            colorscale=[[0, '#dc3545'], [0.7, '#ffc107'], [0.9, '#008751'], [1, '#008751']],
+            marker_line_color='white',
+            marker_line_width=0.5,
+            colorbar=dict(title="Coverage (%)", tickfont=dict(size=14, family="Arial Black")),
+            hovertemplate='<b>%{text}</b><br>%{z:.1f}%<extra></extra>'
+        ))
+        
+        fig.update_geos(fitbounds="locations", visible=False)
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>{ratio_name} by {level_label}</b>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=650,
+            margin=dict(l=0, r=0, t=80, b=0),
+            font=dict(size=18, family="Arial")
+        )
+        
+        return fig
+    
+    def create_completeness_heatmap(self, reported, facility_labels, periods, total_facilities):
+        """Create a facility x period heatmap of which facilities reported"""
+        import plotly.graph_objects as go
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Heatmap(
+            z=reported.astype(int),
+            x=[str(period) for period in periods],
+            y=facility_labels,
+            zmin=0,
+            zmax=1,
+            colorscale=[[0, '#dc3545'], [0.5, '#dc3545'], [0.5, '#008751'], [1, '#008751']],
+            showscale=False,
+            xgap=1,
+            ygap=1,
+            hovertemplate='<b>%{y}</b><br>%{x}<extra></extra>'
+        ))
+        
+        shown = f"{len(facility_labels)} least complete of {total_facilities:,} facilities" \
+            if len(facility_labels) < total_facilities else f"All {total_facilities:,} facilities"
+        fig.update_layout(
+            title=dict(
+                text=f"<b>Reporting by Facility and Period</b><br><sub>{shown} | Green: reported, Red: missing</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=max(500, 14 * len(facility_labels) + 150),
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                side='top',
+                tickfont=dict(size=12, family="Arial Black")
+            ),
+            yaxis=dict(
+                autorange='reversed',
+                tickfont=dict(size=10, family="Arial")
+            )
+        )
+        
+        return fig
+    
+    def create_lagged_cascade_chart(self, same_period, lagged, ratio_name, lag_label):
+        """Create a line chart of a cascade ratio by month, same-period against lagged"""
+        import plotly.graph_objects as go
+        
+        months = [month.strftime('%b %Y') for month in same_period.index]
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Scatter(
+            x=months,
+            y=same_period.values,
+            mode='lines+markers',
+            name="Same Period",
+            line=dict(color='#87CEEB', width=3, dash='dot')
+        ))
+        
+        fig.add_trace(go.Scatter(
+            x=months,
+            y=lagged.reindex(same_period.index).values,
+            mode='lines+markers',
+            name=lag_label,
+            line=dict(color='#008751', width=4)
+        ))
+        
+        fig.add_hline(y=100, line_dash="dash", line_color="red", annotation_text="100%")
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>{ratio_name} by Month</b><br><sub>Same period vs {lag_label.lower()}</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            xaxis_title="Period",
+            yaxis_title="Coverage (%)",
+            height=500,
+            font=dict(size=18, family="Arial"),
+            legend=dict(font=dict(size=16, family="Arial Black")),
+            xaxis=dict(
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            )
+        )
+        
+        return fig
+        
+    def build_cascade_chart(self, name):
+        """Build one of the CASCADE_CHARTS by name"""
+        _, method, args = CASCADE_CHARTS[name]
+        return getattr(self, method)(*args)
+    
+    def summarize_selection(self, cube, selection):
+        """Record count, indicator totals, average reporting rates and coverage ratios for one slice
+        of the aggregate cube"""
+        totals, rates, records = split_totals(PMTCTDashboard(filter_frame(cube, selection), clean=False).indicator_totals())
+        return {
+            'records': records,
+            'totals': dict(zip(totals.index, totals.tolist())),
+            'reporting_rates': {col: round(value, 2) for col, value in rates.items()},
+            'ratios': {name: round(value, 2) for name, value in self.compute_ratios(totals).items()},
+        }
+    
+    def compare_selections(self, cube, selection_a, selection_b):
+        """Coverage ratios and indicator totals for two slices of the aggregate cube, with deltas,
+        and the number of source records in each slice"""
+        counts_a, rates_a, records_a = split_totals(PMTCTDashboard(filter_frame(cube, selection_a), clean=False).indicator_totals())
+        counts_b, rates_b, records_b = split_totals(PMTCTDashboard(filter_frame(cube, selection_b), clean=False).indicator_totals())
+        records = {'A': records_a, 'B': records_b}
+        
+        # Reporting rates are percentages, so they sit with the ratios rather than the counts
+        rate_labels = {col: f"{REPORTING_RATE_COLUMNS[col][0]} Reporting Rate" for col in REPORTING_RATE_COLUMNS}
+        ratios_a = {**self.compute_ratios(counts_a), **rates_a.rename(rate_labels).to_dict()}
+        ratios_b = {**self.compute_ratios(counts_b), **rates_b.rename(rate_labels).to_dict()}
+        ratios = pd.DataFrame({'A (%)': ratios_a, 'B (%)': ratios_b})
+        ratios['Change (pp)'] = ratios['B (%)'] - ratios['A (%)']
+        
+        counts = pd.DataFrame({'A': counts_a, 'B': counts_b}).fillna(0)
+        counts['Change'] = counts['B'] - counts['A']
+        counts['Change (%)'] = [self.calculate_percentage(change, a) if a > 0 else np.nan
+                                for change, a in zip(counts['Change'], counts['A'])]
+        return ratios.round(1), counts, records
+    
+    def create_comparison_chart(self, title, numerator_col, denominator_col, numerator_label, denominator_label):
+        """Create a comparison chart with percentage calculation"""
+        import plotly.graph_objects as go
+        
+        numerator = self.safe_sum(numerator_col)
+        denominator = self.safe_sum(denominator_col)
+        percentage = self.calculate_percentage(numerator, denominator)
+        
+        fig = go.Figure()
+        
+        # Add bars
+        fig.add_trace(go.Bar(
+            x=[denominator_label, numerator_label],
+            y=[denominator, numerator],
+            marker_color=['#008751', '#87CEEB'],
+            text=[f'{denominator:,}', f'{numerator:,}'],
+            textposition='auto',
+            textfont=dict(size=24, color='black', family="Arial Black")  # Much larger text in charts
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>{title}</b><br><sub>Coverage: {percentage:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")  # Larger chart titles
+            ),
+            showlegend=False,
+            height=500,
+            font=dict(size=18, family="Arial"),  # Larger axis labels
+            xaxis=dict(
+                tickfont=dict(size=18, family="Arial Black"),  # Larger x-axis labels
+                title_font=dict(size=20, family="Arial Black")  # Larger x-axis title
+            ),
+            yaxis=dict(
+                tickfont=dict(size=18, family="Arial Black"),  # Larger y-axis labels
+                title_font=dict(size=20, family="Arial Black")  # Larger y-axis title
+            )
+        )
+        
+        return fig, percentage, numerator, denominator
+    
+    def create_anc_hiv_testing_chart(self):
+        """Create ANC HIV testing coverage chart"""
+        import plotly.graph_objects as go
+        
+        anc_clients = self.safe_sum('PMTCT_ANC_1 Number of New ANC clients')
+        hiv_tested_anc = self.safe_sum('PMTCT_HTS_6 Number of  pregnant women HIV tested and received results ANC')
+        testing_rate = self.calculate_percentage(hiv_tested_anc, anc_clients)
+        
+        fig = go.Figure()
+        
+        categories = ['ANC Clients', 'HIV Tested (ANC)']
+        values = [anc_clients, hiv_tested_anc]
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#87CEEB'],
+            text=[f'{anc_clients:,}', f'{hiv_tested_anc:,}'],
+            textposition='auto',
+            textfont=dict(size=24, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>ANC HIV Testing Coverage</b><br><sub>Testing Rate: {testing_rate:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            )
+        )
+        
+        return fig, testing_rate
+    
+    def create_anc_treatment_cascade(self):
+        """Create ANC treatment cascade"""
+        import plotly.graph_objects as go
+        
+        hiv_positive_anc = self.safe_sum('PMTCT_HTS_7. Number of pregnant women tested HIV positive_ ANC')
+        art_early = self.safe_sum('PMTCT_ART_15b. Number of HIV positive pregnant women newly started on  ART during ANC  <36wks of pregnancy')
+        art_late = self.safe_sum('PMTCT_ART_15c. Number of HIV positive pregnant women newly started on  ART during ANC >36wks of pregnancy')
+        
+        total_art_anc = art_early + art_late
+        
+        # Calculate percentages
+        art_early_percentage = self.calculate_percentage(art_early, hiv_positive_anc)
+        art_late_percentage = self.calculate_percentage(art_late, hiv_positive_anc)
+        total_art_percentage = self.calculate_percentage(total_art_anc, hiv_positive_anc)
+        
+        fig = go.Figure()
+        
+        categories = ['HIV Positive (ANC)', 'ART <36wks', 'ART >36wks', 'Total ART']
+        values = [hiv_positive_anc, art_early, art_late, total_art_anc]
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#28a745', '#ffc107', '#dc3545'],
+            text=[f'{val:,}' for val in values],
+            textposition='auto',
+            textfont=dict(size=22, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>ANC Treatment Cascade</b><br><sub>Total ART Coverage: {total_art_percentage:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=18, family="Arial Black"),
+                title_font=dict(size=20, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=18, family="Arial Black"),
+                title_font=dict(size=20, family="Arial Black")
+            )
+        )
+        
+        return fig, total_art_percentage, art_early_percentage, art_late_percentage
+    
+    def create_ld_cascade(self):
+        """Create Labour & Delivery cascade"""
+        import plotly.graph_objects as go
+        
+        hiv_tested_ld = self.safe_sum('PMTCT_HTS_6 Number of  pregnant women HIV tested and received results L&D')
+        hiv_positive_ld = self.safe_sum('PMTCT_HTS_7. Number of pregnant women tested HIV positive_ L&D')
+        art_ld = self.safe_sum('PMTCT_ART_15d. Number of HIV positive pregnant women newly started on  ART during Labour')
+        
+        positivity_rate_ld = self.calculate_percentage(hiv_positive_ld, hiv_tested_ld) if hiv_tested_ld > 0 else 0
+        art_coverage_ld = self.calculate_percentage(art_ld, hiv_positive_ld) if hiv_positive_ld > 0 else 0
+        
+        fig = go.Figure()
+        
+        categories = ['L&D Tested', 'L&D Positive', 'L&D ART']
+        values = [hiv_tested_ld, hiv_positive_ld, art_ld]
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#ffc107', '#dc3545'],
+            text=[f'{val:,}' for val in values],
+            textposition='auto',
+            textfont=dict(size=24, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>Labour & Delivery Cascade</b><br><sub>Positivity: {positivity_rate_ld:.1f}% | ART Coverage: {art_coverage_ld:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            )
+        )
+        
+        return fig, positivity_rate_ld, art_coverage_ld
+    
+    def create_previously_known_chart(self):
+        """Create previously known HIV positive chart"""
+        import plotly.graph_objects as go
+        
+        known_positive = self.safe_sum('PMTCT_HTS_5. Number of pregnant women with previously known HIV positive infection')
+        already_on_art = self.safe_sum('PMTCT_ART_15a. Number of HIV positive pregnant women already on ART prior to this pregnancy')
+        
+        art_coverage_known = self.calculate_percentage(already_on_art, known_positive) if known_positive > 0 else 0
+        
+        fig = go.Figure()
+        
+        categories = ['Previously Known HIV+', 'Already on ART']
+        values = [known_positive, already_on_art]
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#28a745'],
+            text=[f'{val:,}' for val in values],
+            textposition='auto',
+            textfont=dict(size=24, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>Previously Known HIV+ Women</b><br><sub>ART Coverage: {art_coverage_known:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            )
+        )
+        
+        return fig, art_coverage_known
+    
+    def create_hub_spoke_referral(self):
+        """Create hub and spoke referral chart"""
+        import plotly.graph_objects as go
+        
+        referred = self.safe_sum('PMTCT_ART_15h. Number of Pregnant women referred to a Hub facility for treatment')
+        initiated = self.safe_sum('PMTCT_ADDENDUM_15h Number of HIV positive pregnant women  identified in the spoke site who were initiated on ART in the comprehensive site')
+        
+        completion_rate = self.calculate_percentage(initiated, referred) if referred > 0 else 0
+        
+        fig = go.Figure()
+        
+        categories = ['Referred to Hub', 'Initiated at Hub']
+        values = [referred, initiated]
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#87CEEB'],
+            text=[f'{val:,}' for val in values],
+            textposition='auto',
+            textfont=dict(size=24, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>Hub & Spoke Referral System</b><br><sub>Completion Rate: {completion_rate:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=20, family="Arial Black"),
+                title_font=dict(size=22, family="Arial Black")
+            )
+        )
+        
+        return fig, completion_rate
+    
+    def create_eid_chart(self):
+        """Create EID results chart"""
+        import plotly.graph_objects as go
+        
+        samples_taken = self.safe_sum('PMTCT_EID_33. No. of of HEI whose samples were taken within 2 months of birth for DNA PCR')
+        negative_results = self.safe_sum('PMTCT_EID_33. No. of HIV PCR results received for babies whose samples were taken for DNA PCR_Negative')
+        positive_results = self.safe_sum('PMTCT_EID_33. No. of HIV PCR results received for babies whose samples were taken for DNA PCR_Positive')
+        
+        total_results = negative_results + positive_results
+        result_coverage = self.calculate_percentage(total_results, samples_taken)
+        positivity_rate = self.calculate_percentage(positive_results, total_results) if total_results > 0 else 0
+        
+        fig = go.Figure()
+        
+        categories = ['Samples Taken', 'Results Received', 'Negative', 'Positive']
+        values = [samples_taken, total_results, negative_results, positive_results]
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#87CEEB', '#28a745', '#dc3545'],
+            text=[f'{val:,}' for val in values],
+            textposition='auto',
+            textfont=dict(size=22, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text=f"<b>EID Cascade</b><br><sub>Result Coverage: {result_coverage:.1f}% | Positivity: {positivity_rate:.1f}%</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=18, family="Arial Black"),
+                title_font=dict(size=20, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=18, family="Arial Black"),
+                title_font=dict(size=20, family="Arial Black")
+            )
+        )
+        
+        return fig, result_coverage, positivity_rate
+    
+    def create_comprehensive_art_chart(self):
+        """Create comprehensive ART chart including postpartum"""
+        import plotly.graph_objects as go
+        
+        art_early = self.safe_sum('PMTCT_ART_15b. Number of HIV positive pregnant women newly started on  ART during ANC  <36wks of pregnancy')
+        art_late = self.safe_sum('PMTCT_ART_15c. Number of HIV positive pregnant women newly started on  ART during ANC >36wks of pregnancy')
+        art_labour = self.safe_sum('PMTCT_ART_15d. Number of HIV positive pregnant women newly started on  ART during Labour')
+        art_postpartum = self.safe_sum('PMTCT_ART_15e. Number of HIV positive pregnant women newly started on  ART during Post Partum (<72 hrs)')
+        art_already = self.safe_sum('PMTCT_ART_15a. Number of HIV positive pregnant women already on ART prior to this pregnancy')
+        
+        total_new_art = art_early + art_late + art_labour + art_postpartum
+        total_art = total_new_art + art_already
+        
+        categories = ['Already on ART', 'ART <36wks', 'ART >36wks', 'ART Labour', 'ART Postpartum', 'Total New ART', 'Total ART']
+        values = [art_already, art_early, art_late, art_labour, art_postpartum, total_new_art, total_art]
+        
+        fig = go.Figure()
+        
+        fig.add_trace(go.Bar(
+            x=categories,
+            y=values,
+            marker_color=['#008751', '#28a745', '#ffc107', '#dc3545', '#6f42c1', '#17a2b8', '#20c997'],
+            text=[f'{val:,}' for val in values],
+            textposition='auto',
+            textfont=dict(size=20, color='black', family="Arial Black")
+        ))
+        
+        fig.update_layout(
+            title=dict(
+                text="<b>Comprehensive ART Initiation</b><br><sub>All Treatment Categories</sub>",
+                font=dict(size=26, color='black', family="Arial Black")
+            ),
+            height=500,
+            showlegend=False,
+            font=dict(size=18, family="Arial"),
+            xaxis=dict(
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            ),
+            yaxis=dict(
+                tickfont=dict(size=16, family="Arial Black"),
+                title_font=dict(size=18, family="Arial Black")
+            )
+        )
+        
+        return fig
+    
+    def create_reporting_trend(self):
+        """Create reporting rate trend chart"""
+        import plotly.graph_objects as go
+        
+        reporting_cols = [col for col in REPORTING_RATE_COLUMNS if col in self.data.columns]
+        if 'periodname' in self.data.columns and reporting_cols:
+            reporting_data = self.data.groupby('periodname').agg(
+                {col: 'mean' for col in reporting_cols}
+            ).reset_index()
+            
+            fig = go.Figure()
+            
+            for col in reporting_cols:
+                label, color = REPORTING_RATE_COLUMNS[col]
+                fig.add_trace(go.Scatter(
+                    x=reporting_data['periodname'],
+                    y=reporting_data[col],
+                    mode='lines+markers',
+                    name=label,
+                    line=dict(color=color, width=4)
+                ))
+            
+            # Add 90% threshold line
+            fig.add_hline(y=90, line_dash="dash", line_color="red", annotation_text="90% Target")
+            
+            fig.update_layout(
+                title=dict(
+                    text="<b>Reporting Rate Trends</b>",
+                    font=dict(size=26, color='black', family="Arial Black")
+                ),
+                xaxis_title="Period",
+                yaxis_title="Reporting Rate (%)",
+                height=500,
+                font=dict(size=18, family="Arial"),
+                legend=dict(font=dict(size=16, family="Arial Black")),
+                xaxis=dict(
+                    tickfont=dict(size=16, family="Arial Black"),
+                    title_font=dict(size=18, family="Arial Black")
+                ),
+                yaxis=dict(
+                    tickfont=dict(size=16, family="Arial Black"),
+                    title_font=dict(size=18, family="Arial Black")
+                )
+            )
+            
+            return fig
+        return None
+
+def get_quarter_from_month(month_name):
+    """Convert month name to quarter"""
+    month_to_quarter = {
+        'January': 'Quarter 1', 'February': 'Quarter 1', 'March': 'Quarter 1',
+        'April': 'Quarter 2', 'May': 'Quarter 2', 'June': 'Quarter 2',
+        'July': 'Quarter 3', 'August': 'Quarter 3', 'September': 'Quarter 3',
+        'October': 'Quarter 4', 'November': 'Quarter 4', 'December': 'Quarter 4'
+    }
+    return month_to_quarter.get(month_name, 'Unknown Quarter')
+
+def extract_year_from_period(period_name):
+    """Extract year from period name"""
+    # Handle different period formats
+    if isinstance(period_name, str):
+        # Look for 4-digit years
+        year_match = re.search(r'20\d{2}', period_name)
+        if year_match:
+            return year_match.group()
+    return 'Unknown Year'
+
+def filter_frame(frame, selection):
+    """Keep rows whose column values are in the selection; empty selections keep everything"""
+    mask = np.ones(len(frame), dtype=bool)
+    for col, values in selection.items():
+        if values and col in frame.columns:
+            mask &= frame[col].isin(values).to_numpy()
+    return frame[mask]
+
+def split_totals(totals):
+    """Indicator counts, reporting rates averaged over the source records, and the record count
+    from the column sums of an aggregate cube"""
+    records = int(totals.get('record_count', 0))
+    rate_cols = [col for col in REPORTING_RATE_COLUMNS if col in totals.index]
+    rates = totals[rate_cols] / records if records else totals[rate_cols] * np.nan
+    return totals.drop(rate_cols + ['record_count'], errors='ignore'), rates, records
+
+def describe_selection(selection):
+    """Short human-readable label for a filter selection"""
+    parts = []
+    for col, values in selection.items():
+        if values:
+            parts.append(', '.join(map(str, values[:3])) + (f' +{len(values) - 3} more' if len(values) > 3 else ''))
+    return ' | '.join(parts) if parts else 'All data'
+
+def compute_ratio_frame(totals):
+    """Coverage percentages for every row of a frame of indicator totals"""
+    ratios = pd.DataFrame(index=totals.index)
+    for name, (numerator_cols, denominator_cols) in INDICATOR_RATIOS.items():
+        numerator = totals.reindex(columns=numerator_cols, fill_value=0).sum(axis=1)
+        denominator = totals.reindex(columns=denominator_cols, fill_value=0).sum(axis=1)
+        ratios[name] = (numerator / denominator.where(denominator > 0) * 100).fillna(0)
+    return ratios
+
+class AggregationTree:
+    """Indicator totals for every org unit from national down to facility.
+    
+    Every level is aggregated from the cube, and the children of every node are
+    sliced out, when the tree is built; drilling is then a dictionary lookup, and
+    the tree does not grow after it is stored in the result cache.
+    """
+    def __init__(self, cube):
+        self.levels = [col for col in ORG_UNIT_LEVELS if col in cube.columns]
+        self.indicators = [col for col in cube.columns if col not in CUBE_DIMENSIONS]
+        self.level_frames = {0: cube[self.indicators].sum().to_frame().T}
+        for depth in range(1, len(self.levels) + 1):
+            frame = cube.groupby(self.levels[:depth])[self.indicators].sum()
+            if len(frame):
+                # Build the index's lookup table now rather than on the first drill
+                frame.index.get_loc(frame.index[0])
+            self.level_frames[depth] = frame
+        
+        self.children_cache = {}
+        for depth in range(len(self.levels)):
+            frame = self.level_frames[depth + 1]
+            if depth == 0:
+                self.children_cache[()] = frame
+                continue
+            parents = list(range(depth))
+            for path, children in frame.groupby(level=parents, sort=False):
+                self.children_cache[path] = children.droplevel(parents)
+    
+    def level_frame(self, depth):
+        """Totals for every node at a depth (0 is national), indexed by node path"""
+        return self.level_frames[depth]
+    
+    def has_node(self, path):
+        """Check whether a path of org unit names exists in the tree"""
+        if len(path) > len(self.levels):
+            return False
+        if not path:
+            return True
+        frame = self.level_frame(len(path))
+        return (path[0] if len(path) == 1 else tuple(path)) in frame.index
+    
+    def totals(self, path):
+        """Indicator totals for one node"""
+        frame = self.level_frame(len(path))
+        if not path:
+            return frame.iloc[0]
+        return frame.loc[path[0] if len(path) == 1 else tuple(path)]
+    
+    def children(self, path):
+        """Indicator totals for the nodes directly below a node, indexed by name"""
+        path = tuple(path)
+        if len(path) >= len(self.levels):
+            return None
+        return self.children_cache[path]
+    
+    def child_level(self, path):
+        """Column of the level directly below a node, or None at facility level"""
+        return self.levels[len(path)] if len(path) < len(self.levels) else None
+
+def period_months(period_names):
+    """Calendar month of each period name such as 'January 2024'; unparseable names are NaT"""
+    dates = pd.to_datetime(pd.Series(period_names, dtype=object), format='%B %Y', errors='coerce')
+    return pd.PeriodIndex(dates, freq='M')
+
+def calendar_order(period_names):
+    """Positions that put period names in calendar order; names that are not months go last"""
+    months = period_months(period_names)
+    return sorted(range(len(period_names)), key=lambda i: (
+        pd.isna(months[i]), months[i].ordinal if not pd.isna(months[i]) else 0, str(period_names[i])
+    ))
+
+def _lagged_window(values, lag, window):
+    """Mean of the window months ending lag months before each month, along the last axis.
+    
+    Months whose window starts before the first month are NaN.
+    """
+    months = values.shape[-1]
+    cumulative = np.concatenate([np.zeros(values.shape[:-1] + (1,)), np.cumsum(values, axis=-1)], axis=-1)
+    end = np.arange(months) - lag + 1
+    start = end - window
+    valid = start >= 0
+    lagged = np.full(values.shape, np.nan)
+    lagged[..., valid] = (cumulative[..., end[valid]] - cumulative[..., start[valid]]) / window
+    return lagged
+
+class LaggedCascade:
+    """Lagged coverage ratios for every org unit on a complete monthly axis.
+    
+    Numerators and denominators are pivoted once into org unit x month arrays,
+    with months that have no data kept as zeros so that a shift of one column is
+    always one calendar month. Any lag or window is then a shifted running sum
+    of the denominator array, with no regrouping or merging.
+    """
+    def __init__(self, cube, level='orgunitlevel1'):
+        # Period names repeat for every org unit, so only the distinct names are parsed
+        if 'periodname' in cube.columns:
+            period_codes, period_names = pd.factorize(cube['periodname'])
+            months = period_months(period_names)
+        else:
+            period_codes, months = np.full(len(cube), -1), period_months([])
+        parsed = ~months.isna()
+        
+        if parsed.any():
+            self.months = pd.period_range(months[parsed].min(), months[parsed].max(), freq='M')
+            first = self.months[0].ordinal
+            offsets = np.array([month.ordinal - first if ok else -1 for month, ok in zip(months, parsed)], dtype=int)
+            month_codes = offsets[period_codes] if len(offsets) else period_codes
+        else:
+            self.months = pd.PeriodIndex([], freq='M')
+            month_codes = np.full(len(cube), -1)
+        
+        # Rows whose period is not a calendar month are left out
+        has_month = (period_codes >= 0) & (month_codes >= 0)
+        cube = cube[has_month]
+        month_codes = month_codes[has_month]
+        
+        if level in cube.columns:
+            unit_codes, self.units = pd.factorize(cube[level], sort=True)
+        else:
+            unit_codes, self.units = np.zeros(len(cube), dtype=int), pd.Index(['National'])
+        self.level = level
+        
+        # One flat index per cube row into the unit x month grid
+        shape = (len(self.units), len(self.months))
+        cells = unit_codes * shape[1] + month_codes
+        
+        def pivot(cols):
+            weights = np.zeros(len(cube))
+            for col in cols:
+                if col in cube.columns:
+                    weights += cube[col].to_numpy(dtype=float)
+            return np.bincount(cells, weights=weights, minlength=shape[0] * shape[1]).reshape(shape)
+        
+        self.numerators = {name: pivot(numerator_cols) for name, (numerator_cols, _) in LAGGED_RATIOS.items()}
+        self.denominators = {name: pivot(denominator_cols) for name, (_, denominator_cols) in LAGGED_RATIOS.items()}
+    
+    @property
+    def empty(self):
+        return len(self.months) == 0
+    
+    def _month_mask(self, months):
+        """Columns of the month axis to include; None includes every month"""
+        if months is None:
+            return np.ones(len(self.months), dtype=bool)
+        return self.months.isin(months)
+    
+    def ratios(self, name, lag=0, window=1):
+        """Coverage (%) per org unit and month, NaN where the lagged denominator is zero or unavailable"""
+        denominator = _lagged_window(self.denominators[name], lag, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = self.numerators[name] / np.where(denominator > 0, denominator, np.nan) * 100
+        return pd.DataFrame(ratios, index=self.units, columns=self.months)
+    
+    def national(self, name, lag=0, window=1, months=None):
+        """Coverage (%) per month with every org unit summed"""
+        denominator = _lagged_window(self.denominators[name].sum(axis=0), lag, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = self.numerators[name].sum(axis=0) / np.where(denominator > 0, denominator, np.nan) * 100
+        mask = self._month_mask(months)
+        return pd.Series(ratios[mask], index=self.months[mask], name=name)
+    
+    def unit_summary(self, name, lag=0, window=1, months=None):
+        """Coverage (%) per org unit over the months that have a lagged denominator"""
+        numerator = self.numerators[name]
+        denominator = _lagged_window(self.denominators[name], lag, window)
+        # A month only counts once its lagged denominator window is inside the data
+        usable = self._month_mask(months) & (np.arange(len(self.months)) >= lag + window - 1)
+        numerator_total = numerator[:, usable].sum(axis=1)
+        denominator_total = denominator[:, usable].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = numerator_total / np.where(denominator_total > 0, denominator_total, np.nan) * 100
+        return pd.Series(ratios, index=self.units, name=name)
+    
+    def lag_profile(self, name, max_lag=3, window=1, months=None):
+        """Overall coverage and month-to-month swing of the national series for each lag"""
+        rows = []
+        for lag in range(max_lag + 1):
+            series = self.national(name, lag, window, months)
+            rows.append({
+                'Lag (months)': lag,
+                'Months Compared': int(series.notna().sum()),
+                'Mean Coverage (%)': series.mean(),
+                'Month-to-Month Swing (pp)': series.diff().abs().mean(),
+            })
+        return pd.DataFrame(rows).set_index('Lag (months)')
+
+# Set bits in every byte value, for counting the bits of packed bitsets
+_POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+def _popcount(words):
+    """Set bits in each row of a 2-D array of uint64 words"""
+    return _POPCOUNT_TABLE[np.ascontiguousarray(words).view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+def _shift_up(words):
+    """Shift multi-word bitsets one bit towards the later periods"""
+    shifted = words << np.uint64(1)
+    shifted[:, 1:] |= words[:, :-1] >> np.uint64(63)
+    return shifted
+
+class ReportingCompleteness:
+    """Which facility reported in which period, as one bitset per facility.
+    
+    Bit p of a facility's words is set when it reported in period p, over the
+    periods present in the data in calendar order. Counts, missing streaks and
+    per-LGA rates are bitwise operations on the packed words, so 10k facilities
+    over five years fit in under a megabyte.
+    """
+    def __init__(self, cube):
+        self.levels = [col for col in ORG_UNIT_LEVELS if col in cube.columns]
+        if 'periodname' not in cube.columns or 'orgunitlevel3' not in self.levels:
+            self.facilities = pd.MultiIndex.from_arrays([[]] * max(len(self.levels), 1), names=self.levels or None)
+            self.periods = []
+            self.words = np.zeros((0, 1), dtype=np.uint64)
+            return
+        
+        # A facility reported if it has a reporting rate, or failing that any indicator value
+        reporting_cols = [col for col in REPORTING_RATE_COLUMNS if col in cube.columns]
+        value_cols = reporting_cols or [col for col in INDICATOR_COLUMNS if col in cube.columns]
+        reported = np.zeros(len(cube), dtype=bool)
+        for col in value_cols:
+            reported |= cube[col].to_numpy(dtype=float) > 0
+        
+        grouped = cube.groupby(self.levels, sort=True, dropna=False)
+        facility_codes = grouped.ngroup().to_numpy()
+        self.facilities = grouped.size().index
+        if not isinstance(self.facilities, pd.MultiIndex):
+            self.facilities = pd.MultiIndex.from_arrays([self.facilities], names=self.levels)
+        
+        # Periods in calendar order; names that are not months go last
+        period_codes, period_names = pd.factorize(cube['periodname'])
+        order = calendar_order(period_names)
+        self.periods = [period_names[i] for i in order]
+        positions = np.empty(len(order), dtype=np.int64)
+        positions[order] = np.arange(len(order))
+        # Rows without a period name (the cube keeps them) have code -1 and set no bit
+        reported &= period_codes >= 0
+        period_positions = positions[period_codes[reported]]
+        
+        self.words = np.zeros((len(self.facilities), max(1, -(-len(self.periods) // 64))), dtype=np.uint64)
+        bits = np.left_shift(np.uint64(1), (period_positions % 64).astype(np.uint64))
+        np.bitwise_or.at(self.words, (facility_codes[reported], period_positions // 64), bits)
+    
+    @property
+    def empty(self):
+        return len(self.facilities) == 0 or not self.periods
+    
+    def _valid_mask(self):
+        """Bits standing for a period in the data, as one row of words"""
+        mask = np.zeros(self.words.shape[1], dtype=np.uint64)
+        for word in range(len(mask)):
+            bits = min(64, len(self.periods) - 64 * word)
+            mask[word] = np.uint64(0xFFFFFFFFFFFFFFFF) if bits >= 64 else np.uint64((1 << bits) - 1)
+        return mask
+    
+    def missing(self):
+        """Bitsets of the periods each facility did not report"""
+        return ~self.words & self._valid_mask()
+    
+    def _bit(self, words, period):
+        """Whether one period's bit is set, per facility"""
+        return ((words[:, period // 64] >> np.uint64(period % 64)) & np.uint64(1)).astype(bool)
+    
+    def reported_counts(self):
+        return _popcount(self.words)
+    
+    def longest_missing_streak(self):
+        """Most consecutive periods each facility missed"""
+        runs = self.missing()
+        streak = np.zeros(len(runs), dtype=np.int64)
+        # Each pass keeps only bits whose previous period was also missed, so a run of n lasts n passes
+        while runs.any():
+            streak += runs.any(axis=1)
+            runs &= _shift_up(runs)
+        return streak
+    
+    def current_missing_streak(self):
+        """Consecutive periods each facility has missed, up to the latest period"""
+        missing = self.missing()
+        streak = np.zeros(len(missing), dtype=np.int64)
+        still_missing = np.ones(len(missing), dtype=bool)
+        for period in range(len(self.periods) - 1, -1, -1):
+            still_missing &= self._bit(missing, period)
+            if not still_missing.any():
+                break
+            streak += still_missing
+        return streak
+    
+    def matrix(self, facilities=None):
+        """Reported (True) per facility and period, for the given facility positions or all"""
+        words = self.words if facilities is None else self.words[facilities]
+        as_bytes = np.ascontiguousarray(words.astype('<u8')).view(np.uint8)
+        bits = np.unpackbits(as_bytes, axis=1, bitorder='little')[:, :len(self.periods)]
+        return bits.astype(bool)
+    
+    def period_rates(self):
+        """Share of facilities (%) that reported in each period"""
+        counts = [int(self._bit(self.words, period).sum()) for period in range(len(self.periods))]
+        return pd.Series(counts, index=self.periods, dtype=float) / max(len(self.facilities), 1) * 100
+    
+    def facility_table(self):
+        """Reports, completeness and missing streaks per facility"""
+        reported = self.reported_counts()
+        table = pd.DataFrame({
+            'Reported': reported,
+            'Missed': len(self.periods) - reported,
+            'Completeness (%)': reported / max(len(self.periods), 1) * 100,
+            'Longest Missing Streak': self.longest_missing_streak(),
+            'Current Missing Streak': self.current_missing_streak(),
+        }, index=self.facilities)
+        return table
+    
+    def unit_rates(self, level='orgunitlevel2'):
+        """Completeness (%) per org unit above facility level, from each facility's report count"""
+        if level not in self.levels or level == 'orgunitlevel3':
+            return None
+        keys = self.levels[:self.levels.index(level) + 1]
+        unit_codes, unit_index = self.facilities.droplevel(self.levels[len(keys):]).factorize()
+        unit_index = unit_index.set_names(keys if len(keys) > 1 else level)
+        
+        facilities = np.bincount(unit_codes, minlength=len(unit_index))
+        reported = np.bincount(unit_codes, weights=self.reported_counts(), minlength=len(unit_index))
+        missing_latest = np.bincount(unit_codes, weights=self.current_missing_streak() > 0, minlength=len(unit_index))
+        expected = facilities * len(self.periods)
+        
+        return pd.DataFrame({
+            'Facilities': facilities,
+            'Reports Expected': expected,
+            'Reports Received': reported.astype(np.int64),
+            'Completeness (%)': reported / np.maximum(expected, 1) * 100,
+            'Missing Latest Period': missing_latest.astype(np.int64),
+        }, index=unit_index).sort_values('Completeness (%)')
+
+def facility_coverage(facility_totals, ratio_name):
+    """Coverage and denominator volume per facility for one ratio, skipping facilities with no volume"""
+    numerator_cols, denominator_cols = INDICATOR_RATIOS[ratio_name]
+    numerator = facility_totals.reindex(columns=numerator_cols, fill_value=0).sum(axis=1)
+    volume = facility_totals.reindex(columns=denominator_cols, fill_value=0).sum(axis=1)
+    coverage = numerator / volume.where(volume > 0) * 100
+    return pd.DataFrame({'volume': volume, 'coverage': coverage}).dropna()
+
+def _grid_cells(values, cells):
+    """Index of the equal-width grid cell each value falls in"""
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - low) / (high - low) * cells).astype(np.int64), cells - 1)
+
+def bin_scatter_points(coverage, max_points=MAX_SCATTER_POINTS, cells=256):
+    """Thin a facility scatter to at most max_points.
+    
+    Points sharing a cell of a grid over log volume and coverage are merged into
+    the first of them, which carries the number of facilities it stands for.
+    Sparse outliers keep their own cells; the grid coarsens until the limit holds.
+    """
+    names = [' / '.join(map(str, name)) if isinstance(name, tuple) else str(name) for name in coverage.index]
+    points = pd.DataFrame({
+        'name': names,
+        'volume': coverage['volume'].to_numpy(),
+        'coverage': coverage['coverage'].to_numpy(),
+        'facilities': 1,
+    })
+    if len(points) <= max_points:
+        return points
+    
+    log_volume = np.log10(points['volume'].to_numpy())
+    values = points['coverage'].to_numpy()
+    while True:
+        cell = _grid_cells(log_volume, cells) * cells + _grid_cells(values, cells)
+        _, first, counts = np.unique(cell, return_index=True, return_counts=True)
+        if len(first) <= max_points or cells <= 2:
+            break
+        cells //= 2
+    
+    points = points.iloc[first].reset_index(drop=True)
+    points['facilities'] = counts
+    return points
+
+def coverage_histogram(coverage, bin_width=HISTOGRAM_BIN_WIDTH):
+    """Facility counts per coverage bin; values above the last edge fall in an overflow bin"""
+    values = coverage['coverage'].to_numpy()
+    upper = max(100, min(np.ceil(np.percentile(values, 99) / bin_width) * bin_width, 200)) if len(values) else 100
+    edges = np.append(np.arange(0, upper + bin_width, bin_width), np.inf)
+    counts, _ = np.histogram(np.clip(values, 0, None), bins=edges)
+    return counts, edges
+
+def coverage_box_stats(coverage, level=0):
+    """Quartiles and whisker ends of facility coverage per org unit at an index level"""
+    values = coverage['coverage']
+    grouped = values.groupby(level=level)
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    quartiles.columns = ['q1', 'median', 'q3']
+    
+    # Whiskers end at the most extreme facilities within 1.5 IQR of the box
+    iqr = quartiles['q3'] - quartiles['q1']
+    group_keys = values.index.get_level_values(level)
+    low_bound = (quartiles['q1'] - 1.5 * iqr).reindex(group_keys).to_numpy()
+    high_bound = (quartiles['q3'] + 1.5 * iqr).reindex(group_keys).to_numpy()
+    quartiles['lowerfence'] = values.where(values.to_numpy() >= low_bound).groupby(level=level).min()
+    quartiles['upperfence'] = values.where(values.to_numpy() <= high_bound).groupby(level=level).max()
+    quartiles['facilities'] = grouped.size()
+    return quartiles
+
+def normalize_boundary_name(name):
+    """Org unit or boundary name reduced for matching across sources.
+    
+    Drops the lower-case DHIS2 code prefix ('kn Kano State'), 'State' and
+    'Local Government Area' suffixes, case and punctuation.
+    """
+    name = re.sub(r'^[a-z]{2}\s+', '', str(name).strip()).lower()
+    name = re.sub(r'[^a-z0-9]+', ' ', name)
+    name = re.sub(r'\s+(state|local government area|local government|lga)$', '', name.strip())
+    name = ' '.join(name.split())
+    return BOUNDARY_NAME_ALIASES.get(name, name)
+
+def _feature_property(properties, candidates):
+    """First of the candidate properties present on a boundary feature"""
+    for key in candidates:
+        if properties.get(key) not in (None, ''):
+            return properties[key]
+    return None
+
+def _douglas_peucker(points, tolerance, splits=()):
+    """Mask of the points kept when simplifying a chain whose end points (and splits) are fixed"""
+    keep = np.zeros(len(points), dtype=bool)
+    anchors = sorted({0, len(points) - 1, *splits})
+    keep[anchors] = True
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        inner = points[first + 1:last] - start
+        direction = end - start
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(direction[0] * inner[:, 1] - direction[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.extend([(first, index), (index, last)])
+    return keep
+
+class BoundaryLayer:
+    """Boundaries for one org unit level, indexed by name and simplified once per zoom level.
+    
+    Coordinates are snapped to a grid so that neighbouring areas share exact
+    vertices. Rings are split into arcs wherever the set of rings through a
+    vertex changes, and each arc is simplified once, so shared borders stay
+    shared at every zoom, with no gaps or overlaps between areas.
+    """
+    def __init__(self, collection, name_properties, parent_properties=()):
+        scale = 10 ** BOUNDARY_PRECISION
+        self.names = []
+        self.parents = []
+        # Per feature, a list of polygons, each a list of rings of vertex ids
+        self.polygons = []
+        rings = []
+        
+        for feature in collection.get('features', []):
+            properties = feature.get('properties') or {}
+            geometry = feature.get('geometry') or {}
+            name = _feature_property(properties, name_properties)
+            if name is None or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+                continue
+            parts = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+            polygons = []
+            for part in parts:
+                polygon = []
+                for ring in part:
+                    coords = np.round(np.asarray(ring, dtype=float)[:, :2] * scale).astype(np.int64)
+                    # Drop the closing point and repeats left by snapping
+                    coords = coords[np.any(coords != np.roll(coords, 1, axis=0), axis=1)]
+                    if len(coords) >= 3:
+                        polygon.append(len(rings))
+                        rings.append(coords)
+                if polygon:
+                    polygons.append(polygon)
+            if polygons:
+                self.names.append(str(name))
+                self.parents.append(_feature_property(properties, parent_properties))
+                self.polygons.append(polygons)
+        
+        # Shared vertices get a single id
+        if rings:
+            self.vertices, vertex_ids = np.unique(np.concatenate(rings), axis=0, return_inverse=True)
+            vertex_ids = vertex_ids.ravel()
+        else:
+            self.vertices, vertex_ids = np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=int)
+        self.points = self.vertices / scale
+        offsets = np.cumsum([0] + [len(ring) for ring in rings])
+        self.rings = [vertex_ids[offsets[i]:offsets[i + 1]] for i in range(len(rings))]
+        
+        # Name index: areas per parent state, and names that are unique across the file
+        self.children = {}
+        positions = {}
+        for position, (name, parent) in enumerate(zip(self.names, self.parents)):
+            key = normalize_boundary_name(name)
+            positions.setdefault(key, []).append(position)
+            if parent is not None:
+                self.children.setdefault(normalize_boundary_name(parent), {})[key] = position
+        self.unique_names = {key: found[0] for key, found in positions.items() if len(found) == 1}
+        self.repeated_names = {key for key, found in positions.items() if len(found) > 1}
+        
+        self.arcs = None
+        self.simplified = {}
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def _split_arcs(self):
+        """Split every ring into arcs between junctions: (ring, [(arc key, reversed)])"""
+        ring_ids = np.repeat(np.arange(len(self.rings)), [len(ring) for ring in self.rings])
+        vertex_ids = np.concatenate(self.rings) if self.rings else np.zeros(0, dtype=int)
+        
+        # Order-independent signature of the set of rings passing through each vertex
+        ring_tokens = np.random.default_rng(0).integers(1, 2 ** 62, len(self.rings), dtype=np.int64).astype(np.uint64)
+        pairs = np.unique(np.stack([vertex_ids, ring_ids], axis=1), axis=0)
+        signatures = np.zeros(len(self.vertices), dtype=np.uint64)
+        np.add.at(signatures, pairs[:, 0], ring_tokens[pairs[:, 1]])
+        
+        arcs = []
+        for ring in self.rings:
+            signature = signatures[ring]
+            junctions = np.flatnonzero((signature != np.roll(signature, 1)) | (signature != np.roll(signature, -1)))
+            if len(junctions) == 0:
+                # A ring shared with nobody, or entirely with one other ring: one closed arc
+                # starting from its smallest vertex id so both sides agree
+                start = int(np.argmin(ring))
+                chain = np.concatenate([ring[start:], ring[:start], ring[start:start + 1]])
+                pieces = [chain]
+            else:
+                rotated = np.concatenate([ring[junctions[0]:], ring[:junctions[0]]])
+                cuts = list(junctions - junctions[0]) + [len(ring)]
+                rotated = np.concatenate([rotated, rotated[:1]])
+                pieces = [rotated[cuts[i]:cuts[i + 1] + 1] for i in range(len(cuts) - 1)]
+            
+            ring_arcs = []
+            for piece in pieces:
+                forward = (piece[0], piece[1]) < (piece[-1], piece[-2])
+                ring_arcs.append((tuple(piece) if forward else tuple(piece[::-1]), not forward))
+            arcs.append(ring_arcs)
+        return arcs
+    
+    def _simplify(self, tolerance):
+        """Simplified rings as arrays of vertex ids, each arc simplified once"""
+        with self.lock:
+            if self.arcs is None:
+                self.arcs = self._split_arcs()
+        kept_arcs = {}
+        rings = []
+        for ring_arcs in self.arcs:
+            parts = []
+            for key, reverse in ring_arcs:
+                if key not in kept_arcs:
+                    chain = np.asarray(key)
+                    closed = chain[0] == chain[-1]
+                    # Closed arcs keep two inner anchors so they cannot collapse to a line
+                    splits = (len(chain) // 3, 2 * len(chain) // 3) if closed else ()
+                    kept_arcs[key] = chain[_douglas_peucker(self.points[chain], tolerance, splits)]
+                kept = kept_arcs[key]
+                parts.append((kept[::-1] if reverse else kept)[:-1])
+            rings.append(np.concatenate(parts))
+        return rings
+    
+    def geojson(self, zoom):
+        """FeatureCollection simplified for a zoom level in MAP_ZOOM_TOLERANCES, built once per zoom"""
+        with self.lock:
+            if zoom in self.simplified:
+                return self.simplified[zoom]
+        
+        rings = self._simplify(MAP_ZOOM_TOLERANCES[zoom])
+        features = []
+        for position, polygons in enumerate(self.polygons):
+            coordinates = []
+            for polygon in polygons:
+                # Rings thinner than a triangle at this zoom are dropped, outer ring first
+                parts = [rings[ring] for ring in polygon]
+                if len(parts[0]) < 3:
+                    continue
+                coordinates.append([
+                    np.round(self.points[np.append(part, part[0])], BOUNDARY_PRECISION).tolist()
+                    for part in parts if len(part) >= 3
+                ])
+            if not coordinates:
+                # Too small to draw at this zoom: keep the full outline rather than lose the area
+                coordinates = [[np.round(self.points[np.append(self.rings[ring], self.rings[ring][0])], BOUNDARY_PRECISION).tolist()
+                                for ring in polygon] for polygon in polygons]
+            features.append({
+                'type': 'Feature',
+                'id': str(position),
+                'properties': {'name': self.names[position]},
+                'geometry': {'type': 'MultiPolygon', 'coordinates': coordinates},
+            })
+        collection = {'type': 'FeatureCollection', 'features': features}
+        
+        with self.lock:
+            self.simplified[zoom] = collection
+        return collection
+    
+    def subset(self, zoom, feature_ids):
+        """The zoom level's FeatureCollection limited to the given feature ids"""
+        wanted = set(feature_ids)
+        features = self.geojson(zoom)['features']
+        return {'type': 'FeatureCollection', 'features': [feature for feature in features if feature['id'] in wanted]}
+    
+    def match_areas(self, areas):
+        """Feature id for each (name, parent state) org unit, or None.
+        
+        Exact name matches are made first. The remaining names are matched by
+        spelling to features no other org unit has claimed, closest pairs first
+        and never across a direction word, so each feature is drawn for at most
+        one org unit. The parent tells apart LGAs with the same name.
+        """
+        feature_ids = [None] * len(areas)
+        claimed = set()
+        unmatched = []
+        for i, (name, parent) in enumerate(areas):
+            key = normalize_boundary_name(name)
+            candidates = self.children.get(normalize_boundary_name(parent)) if parent is not None else None
+            if not candidates:
+                # Without its state, a name used in several states cannot be placed
+                if key in self.repeated_names:
+                    continue
+                candidates = self.unique_names
+            if key in candidates and candidates[key] not in claimed:
+                feature_ids[i] = candidates[key]
+                claimed.add(candidates[key])
+            else:
+                unmatched.append((i, key, candidates))
+        
+        # Spelling differences between the boundary file and NDARS
+        scored = []
+        for i, key, candidates in unmatched:
+            directions = set(key.split()) & BOUNDARY_DIRECTION_WORDS
+            matcher = difflib.SequenceMatcher(b=key)
+            for candidate, position in candidates.items():
+                if position in claimed or set(candidate.split()) & BOUNDARY_DIRECTION_WORDS != directions:
+                    continue
+                matcher.set_seq1(candidate)
+                if (matcher.real_quick_ratio() >= BOUNDARY_MATCH_CUTOFF and matcher.quick_ratio() >= BOUNDARY_MATCH_CUTOFF
+                        and matcher.ratio() >= BOUNDARY_MATCH_CUTOFF):
+                    scored.append((-matcher.ratio(), i, position))
+        for _, i, position in sorted(scored):
+            if feature_ids[i] is None and position not in claimed:
+                feature_ids[i] = position
+                claimed.add(position)
+        
+        return [str(position) if position is not None else None for position in feature_ids]
+
+def boundary_file(level, directory=None):
+    """Path of the local boundary file for an org unit level, or None if it has not been added"""
+    if level not in BOUNDARY_FILES:
+        return None
+    path = os.path.join(directory or BOUNDARY_DIR, BOUNDARY_FILES[level])
+    return path if os.path.isfile(path) else None
+
+def load_boundary_layer(path, level):
+    """Read a GeoJSON boundary file into a BoundaryLayer for an org unit level"""
+    with open(path, encoding='utf-8-sig') as f:
+        collection = json.load(f)
+    parent_properties = BOUNDARY_PARENT_PROPERTIES if level != 'orgunitlevel1' else ()
+    return BoundaryLayer(collection, BOUNDARY_NAME_PROPERTIES[level], parent_properties)
+
+def map_zoom(selection):
+    """Zoom level for the map: detailed when only a few states are shown"""
+    states = selection.get('orgunitlevel1') or []
+    return 'state' if 0 < len(states) <= MAP_DETAIL_STATES else 'national'
+
+def normalize_column_name(name):
+    """Column name with case and runs of whitespace ignored"""
+    return ' '.join(str(name).split()).lower()
+
+class SchemaReport:
+    """Result of checking a dataset's columns against the ones the dashboard reads"""
+    def __init__(self, found, missing, renames, suggestions, non_numeric, missing_dimensions, notes=None):
+        self.found = found
+        self.missing = missing
+        self.renames = renames
+        self.suggestions = suggestions
+        self.non_numeric = non_numeric
+        self.missing_dimensions = missing_dimensions
+        self.notes = list(notes or [])
+    
+    @property
+    def usable(self):
+        """Whether any indicator the dashboard reads is present"""
+        return bool(self.found)
+    
+    @property
+    def complete(self):
+        """Whether every indicator and org unit column is present and numeric where expected"""
+        return not (self.missing or self.non_numeric or self.missing_dimensions or self.notes)
+    
+    def messages(self):
+        """Human-readable problems, most serious first"""
+        messages = []
+        if not self.usable:
+            messages.append("None of the PMTCT indicator columns were found. "
+                            "Is this the NDARS PMTCT monthly summary export?")
+        for expected, found in self.renames.items():
+            messages.append(f"Using '{found}' for '{expected}'")
+        for expected in self.missing:
+            suggestion = self.suggestions.get(expected)
+            hint = f" Did you mean '{suggestion}'?" if suggestion else ""
+            effect = "it is left out of the reporting trend" if expected in REPORTING_RATE_COLUMNS else "it will count as 0"
+            messages.append(f"Missing '{expected}'; {effect}.{hint}")
+        for col in self.non_numeric:
+            messages.append(f"'{col}' is not numeric in the first rows")
+        for col in self.missing_dimensions:
+            messages.append(f"Missing '{col}'; filters on it are unavailable")
+        messages.extend(self.notes)
+        return messages
+
+def validate_schema(sample):
+    """Check the header and first rows of a dataset before the whole file is parsed.
+    
+    Columns that differ from the expected name only by case or spacing are
+    renamed; other missing columns get the closest remaining name as a suggestion,
+    with each remaining name suggested for at most one missing column.
+    """
+    columns = [str(col) for col in sample.columns]
+    present = set(columns)
+    by_normal_name = {normalize_column_name(col): col for col in columns}
+    
+    found, missing, renames = [], [], {}
+    for expected in INDICATOR_COLUMNS:
+        if expected in present:
+            found.append(expected)
+        elif normalize_column_name(expected) in by_normal_name:
+            renames[expected] = by_normal_name[normalize_column_name(expected)]
+            found.append(expected)
+        else:
+            missing.append(expected)
+    
+    unmatched = [col for col in columns if col not in set(found) | set(renames.values()) | set(DIMENSION_COLUMNS)]
+    # Best-scoring pairs are matched first, so a column goes to the name it resembles most
+    scored = []
+    for expected in missing:
+        matcher = difflib.SequenceMatcher(b=expected)
+        for col in unmatched:
+            matcher.set_seq1(col)
+            if matcher.real_quick_ratio() >= 0.75 and matcher.quick_ratio() >= 0.75 and matcher.ratio() >= 0.75:
+                scored.append((-matcher.ratio(), INDICATOR_COLUMNS.index(expected), col, expected))
+    suggestions = {}
+    for _, _, col, expected in sorted(scored):
+        if expected not in suggestions and col not in suggestions.values():
+            suggestions[expected] = col
+    
+    non_numeric = []
+    for expected in found:
+        values = sample[renames.get(expected, expected)].dropna()
+        if len(values) and pd.to_numeric(values, errors='coerce').isna().mean() > 0.5:
+            non_numeric.append(expected)
+    
+    missing_dimensions = [col for col in CUBE_DIMENSIONS if col not in present]
+    return SchemaReport(found, missing, renames, suggestions, non_numeric, missing_dimensions)
+
+def apply_schema_renames(data, report):
+    """Rename columns to the names the dashboard expects"""
+    if not report.renames:
+        return data
+    return data.rename(columns={found: expected for expected, found in report.renames.items()})
+
+def read_csv_checked(f):
+    """Read a CSV after checking its schema on a small sample; raises ValueError if unusable"""
+    start = f.tell()
+    report = validate_schema(pd.read_csv(f, nrows=SCHEMA_SAMPLE_ROWS))
+    if not report.usable:
+        raise ValueError(report.messages()[0])
+    f.seek(start)
+    return apply_schema_renames(pd.read_csv(f), report), report
+
+class JSONStreamReader:
+    """Incremental reader for a JSON document with one top-level object.
+    
+    Small members are decoded whole; members holding large arrays are yielded
+    one item at a time, so the full document is never held as Python objects.
+    """
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+    
+    def fill(self, size=None):
+        """Append more text to the buffer, dropping what has been consumed"""
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+    
+    def peek(self):
+        """Next non-whitespace character, or '' at the end of the document"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+    
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON: expected '{char}' near character {self.pos}")
+        self.pos += 1
+    
+    def value(self):
+        """Decode the next complete value, reading more of the file as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number touching the end of the buffer may continue in the next chunk
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.eof or not is_number or (end < len(self.buffer) and self.buffer[end] not in '0123456789+-.eE'):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError("Invalid or truncated JSON document")
+            # Grow reads with the pending value so large members decode in few passes
+            self.fill(max(self.chunk_size, len(self.buffer) - self.pos))
+    
+    def members(self, streamed_keys):
+        """Yield (key, value, is_item) for each top-level member, streaming the listed arrays"""
+        self.expect('{')
+        while self.peek() != '}':
+            key = self.value()
+            self.expect(':')
+            if key in streamed_keys and self.peek() == '[':
+                self.pos += 1
+                while self.peek() != ']':
+                    yield key, self.value(), True
+                    if self.peek() == ',':
+                        self.pos += 1
+                self.pos += 1
+            else:
+                yield key, self.value(), False
+            if self.peek() == ',':
+                self.pos += 1
+            elif self.peek() != '}':
+                raise ValueError(f"Invalid JSON: expected ',' or '}}' near character {self.pos}")
+
+def dhis2_period_name(period_id, names):
+    """Display name of a DHIS2 period, e.g. 202401 -> January 2024"""
+    if period_id in names:
+        return names[period_id]
+    try:
+        return datetime.strptime(period_id, '%Y%m').strftime('%B %Y')
+    except ValueError:
+        return period_id
+
+def dhis2_org_units(org_unit_id, names, name_hierarchy):
+    """Org unit columns for a DHIS2 org unit from its name path, or just its own name.
+    
+    The path is aligned from the top, so a state's path ('/Nigeria/Kano') fills
+    the state column and leaves the LGA and facility columns empty. Paths deeper
+    than the columns (with wards) put their leaf in the facility column. Without
+    a path the org unit is taken to be a facility.
+    """
+    path = [part for part in name_hierarchy.get(org_unit_id, '').split('/') if part]
+    if not path:
+        return {DHIS2_ORG_UNIT_COLUMNS[-1]: names.get(org_unit_id, org_unit_id)}
+    levels = path[DHIS2_ROOT_LEVELS:]
+    if len(levels) > len(DHIS2_ORG_UNIT_COLUMNS):
+        levels = levels[:len(DHIS2_ORG_UNIT_COLUMNS) - 1] + levels[-1:]
+    return {col: levels[i] if i < len(levels) else None for i, col in enumerate(DHIS2_ORG_UNIT_COLUMNS)}
+
+def dhis2_element_names(metadata):
+    """Names of the data elements listed in an analytics export's metaData"""
+    items = metadata.get('items', {})
+    element_ids = metadata.get('dimensions', {}).get('dx') or list(items)
+    return [items[uid].get('name', uid) if uid in items else uid for uid in element_ids]
+
+def _pivot_dhis2_members(reader, check_columns=None):
+    """Sum streamed analytics rows or data values per (period, org unit) and data element.
+    
+    The header, the first data value and (through check_columns) the data
+    elements named in metaData are checked before anything is pivoted.
+    """
+    headers = None
+    metadata = {}
+    pivot = {}
+    checked = False
+    for key, value, is_item in reader.members({'rows', 'dataValues'}):
+        if not is_item:
+            if key == 'headers':
+                headers = {header.get('name'): i for i, header in enumerate(value)}
+                missing = [name for name in ('dx', 'pe', 'ou', 'value') if name not in headers]
+                if missing:
+                    raise ValueError(f"Analytics JSON headers are missing: {', '.join(missing)}")
+            elif key == 'metaData':
+                metadata = value
+            continue
+        
+        if not checked:
+            checked = True
+            if key == 'dataValues' and not isinstance(value, dict):
+                raise ValueError("dataValueSets JSON values must be objects")
+            if key == 'dataValues':
+                missing = [name for name in DHIS2_DATA_VALUE_FIELDS if name not in value]
+                if missing:
+                    raise ValueError(f"dataValueSets JSON values are missing: {', '.join(missing)}")
+            if key == 'rows' and metadata and check_columns is not None:
+                check_columns(dhis2_element_names(metadata))
+        
+        if key == 'rows':
+            if headers is None:
+                raise ValueError("Analytics JSON must list its headers before its rows")
+            element = value[headers['dx']]
+            period, org_unit, amount = value[headers['pe']], value[headers['ou']], value[headers['value']]
+        else:
+            element = value.get('dataElement')
+            combo = value.get('categoryOptionCombo')
+            if combo and combo != 'default':
+                element = f"{element} {combo}"
+            period, org_unit, amount = value.get('period'), value.get('orgUnit'), value.get('value')
+        
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            continue
+        cell = pivot.setdefault((period, org_unit), {})
+        cell[element] = cell.get(element, 0) + amount
+    
+    if headers is None and not pivot:
+        raise ValueError("Not a DHIS2 analytics or dataValueSets JSON export")
+    return headers, metadata, pivot
+
+def read_dhis2_json(f, check_columns=None):
+    """Pivot a DHIS2/NDARS analytics or dataValueSets JSON export into one row per period and org unit.
+    
+    Analytics exports (headers + rows, as saved from pivot tables) are named from
+    their metaData; dataValueSets exports should be requested with idScheme=NAME
+    so that data elements and org units carry names rather than UIDs. Values are
+    summed into the pivot as they stream past. check_columns is called with the
+    data element names from metaData before the first row is pivoted. Org units
+    with others of the export below them are totals of those and are left out.
+    Returns the dataset and notes on what was left out or could not be read.
+    """
+    wrapped = not isinstance(f, io.TextIOBase)
+    text = io.TextIOWrapper(f, encoding='utf-8-sig') if wrapped else f
+    try:
+        headers, metadata, pivot = _pivot_dhis2_members(JSONStreamReader(text), check_columns)
+    finally:
+        # Leave the caller's binary file open
+        if wrapped:
+            text.detach()
+    
+    names = {uid: item.get('name', uid) for uid, item in metadata.get('items', {}).items()}
+    name_hierarchy = metadata.get('ouNameHierarchy', {})
+    paths = {org_unit: tuple(part for part in name_hierarchy.get(org_unit, '').split('/') if part)
+             for org_unit in {org_unit for _, org_unit in pivot}}
+    ancestors = {path[:i] for path in paths.values() for i in range(1, len(path))}
+    
+    # Rows are built as the pivot empties, so the two are never both held whole
+    records = []
+    aggregates = set()
+    for key in list(pivot):
+        period, org_unit = key
+        values = pivot.pop(key)
+        path = paths[org_unit]
+        if path in ancestors:
+            aggregates.add(path[-1])
+            continue
+        record = {'periodname': dhis2_period_name(period, names), 'periodid': period}
+        record.update(dhis2_org_units(org_unit, names, name_hierarchy))
+        record['organisationunitname'] = names.get(org_unit, path[-1] if path else org_unit)
+        record.update({names.get(element, element): amount for element, amount in values.items()})
+        records.append(record)
+    
+    notes = []
+    if not name_hierarchy:
+        notes.append("The export has no org unit hierarchy (ouNameHierarchy), so org units are "
+                     "taken to be facilities and the state and LGA filters and the map are unavailable. "
+                     "Export analytics JSON with the hierarchy included, or the CSV export.")
+    if aggregates:
+        notes.append(f"{len(aggregates)} org unit(s) above facility level (e.g. {sorted(aggregates)[0]}) were "
+                     "left out because the export also has the org units below them, which they total.")
+    return pd.DataFrame.from_records(records), notes
+
+def read_json_checked(f):
+    """Read a DHIS2 JSON export and check its schema; raises ValueError if unusable.
+    
+    Analytics exports are checked from their header and metaData, before any
+    rows are pivoted; dataValueSets exports carry no list of their data
+    elements, so their schema is checked once they have been read.
+    """
+    def check_columns(columns):
+        report = validate_schema(pd.DataFrame(columns=DIMENSION_COLUMNS + columns))
+        if not report.usable:
+            raise ValueError(report.messages()[0])
+    
+    data, notes = read_dhis2_json(f, check_columns)
+    report = validate_schema(data.head(SCHEMA_SAMPLE_ROWS))
+    if not report.usable:
+        raise ValueError(report.messages()[0])
+    report.notes.extend(notes)
+    return apply_schema_renames(data, report), report
+
+def zip_extract_sources(zip_path):
+    """(archive path, member name) for every CSV extract inside a ZIP bundle"""
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [info.filename for info in archive.infolist()
+                   if not info.is_dir()
+                   and info.filename.lower().endswith('.csv')
+                   and not os.path.basename(info.filename).startswith(('.', '__MACOSX'))
+                   and '__MACOSX/' not in info.filename]
+    return [(zip_path, member) for member in sorted(members)]
+
+def directory_extract_sources(directory):
+    """(file path, None) for every CSV extract in a folder"""
+    return [(os.path.join(directory, name), None) for name in sorted(os.listdir(directory))
+            if name.lower().endswith('.csv') and os.path.isfile(os.path.join(directory, name))]
+
+def resolve_extract_directory(path, root):
+    """Real path of an extract folder given relative to (or inside) root; raises ValueError otherwise"""
+    root = os.path.realpath(root)
+    directory = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, directory]) != root:
+        raise ValueError(f"Folder is outside the extract folder: {path}")
+    if not os.path.isdir(directory):
+        raise ValueError(f"Folder not found: {path}")
+    return directory
+
+def directory_signature(directory):
+    """Names, sizes and modification times of the extracts in a folder"""
+    return tuple((path, os.path.getsize(path), os.path.getmtime(path))
+                 for path, _ in directory_extract_sources(directory))
+
+def extract_name(source):
+    """File name of an extract for messages"""
+    path, member = source
+    return member if member is not None else os.path.basename(path)
+
+def open_extract(source):
+    """Open an extract as a binary file, reading straight from the archive for ZIP members"""
+    path, member = source
+    if member is None:
+        return open(path, 'rb')
+    # The member stays readable after the archive is closed, until it is closed itself
+    with zipfile.ZipFile(path) as archive:
+        return archive.open(member)
+
+def read_extract_header(source):
+    """Column names of an extract, read from its first line only"""
+    with open_extract(source) as f:
+        line = io.TextIOWrapper(f, encoding='utf-8-sig', newline='').readline()
+    return next(csv.reader([line]), [])
+
+def read_extract_sample(source):
+    """First rows of an extract, for schema checks"""
+    with open_extract(source) as f:
+        return pd.read_csv(f, nrows=SCHEMA_SAMPLE_ROWS)
+
+def _read_extract(source, columns=None):
+    """Parse and clean one extract, in the bundle's column order; runs in a worker process"""
+    with open_extract(source) as f:
+        data = PMTCTDashboard(pd.read_csv(f)).data
+    return data if columns is None or list(data.columns) == columns else data[columns]
+
+def validate_extract_columns(sources):
+    """Check every extract has the same columns as the first, before any parsing"""
+    headers = [read_extract_header(source) for source in sources]
+    expected = set(headers[0])
+    problems = []
+    for source, header in zip(sources[1:], headers[1:]):
+        missing = sorted(expected - set(header))
+        unexpected = sorted(set(header) - expected)
+        if missing or unexpected:
+            problems.append(f"{extract_name(source)}: missing {missing}, unexpected {unexpected}")
+    if problems:
+        raise ValueError(f"Extracts do not have the same columns as {extract_name(sources[0])}:\n" + "\n".join(problems))
+    return headers[0]
+
+def load_extract_bundle(sources, max_workers=None):
+    """Parse and clean many extracts across a process pool and stack them into one dataset,
+    returned with the schema report of the first extract.
+    
+    Workers read their own file or ZIP member and return it in the bundle's
+    column order, so the parent only ever holds the cleaned frames that are
+    concatenated.
+    """
+    if not sources:
+        raise ValueError("No CSV extracts found")
+    columns = validate_extract_columns(sources)
+    report = validate_schema(read_extract_sample(sources[0]))
+    if not report.usable:
+        raise ValueError(f"{extract_name(sources[0])}: {report.messages()[0]}")
+    
+    if len(sources) == 1:
+        return apply_schema_renames(_read_extract(sources[0]), report), report
+    
+    max_workers = max_workers or min(len(sources), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        data = pd.concat(pool.map(_read_extract, sources, [columns] * len(sources)), ignore_index=True)
+    return apply_schema_renames(data, report), report
+
+def read_dataset(path):
+    """Read a CSV or DHIS2 JSON export, a ZIP of extracts or a folder of extracts as one cleaned dataset"""
+    if os.path.isdir(path):
+        return load_extract_bundle(directory_extract_sources(path))[0]
+    if zipfile.is_zipfile(path):
+        return load_extract_bundle(zip_extract_sources(path))[0]
+    with open(path, 'rb') as f:
+        data, _ = read_json_checked(f) if path.lower().endswith('.json') else read_csv_checked(f)
+    return PMTCTDashboard(data).data
+
+def dataset_fingerprint(data):
+    """Stable hash of a dataset's columns and values"""
+    digest = hashlib.sha1('\x1f'.join(map(str, data.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+def canonical_filter_key(selection):
+    """Order-independent string for a filter selection, ignoring empty filters"""
+    canonical = {col: sorted(map(str, values)) for col, values in selection.items() if values}
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+def encode_filter_params(selection, options):
+    """Compact query parameters for a selection.
+
+    Filters that keep every option are left out; filters that keep most of
+    their options list the dropped values under a not_ parameter instead.
+    """
+    params = {}
+    for param, col in FILTER_PARAMS.items():
+        chosen = set(selection.get(col) or [])
+        available = options.get(col, [])
+        if not chosen or chosen.issuperset(available):
+            continue
+        kept = [value for value in available if value in chosen]
+        dropped = [value for value in available if value not in chosen]
+        if len(dropped) < len(kept):
+            params[EXCLUDE_PARAM_PREFIX + param] = [str(value) for value in dropped]
+        else:
+            params[param] = [str(value) for value in kept]
+    return params
+
+def decode_filter_params(params, options):
+    """Selection from query parameters; values not in the dataset are ignored and
+    filters absent from the parameters are None"""
+    selection = {}
+    for param, col in FILTER_PARAMS.items():
+        available = options.get(col, [])
+        by_name = {str(value): value for value in available}
+        if param in params:
+            chosen = {by_name[value] for value in params[param] if value in by_name}
+            selection[col] = [value for value in available if value in chosen]
+        elif EXCLUDE_PARAM_PREFIX + param in params:
+            dropped = {by_name[value] for value in params[EXCLUDE_PARAM_PREFIX + param] if value in by_name}
+            selection[col] = [value for value in available if value not in dropped]
+        else:
+            selection[col] = None
+    return selection
+
+def estimate_nbytes(value, seen=None):
+    """Rough memory held by a cached result, in bytes.
+    
+    Frames and arrays report their buffers; figures, containers and plain
+    objects are walked, counting each object they share only once.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, 'to_plotly_json'):
+        return estimate_nbytes(value.to_plotly_json(), seen)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_nbytes(key, seen) + estimate_nbytes(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_nbytes(item, seen) for item in value)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        size += estimate_nbytes(vars(value), seen)
+    return size
+
+class ResultCache:
+    """Thread-safe LRU cache of computed results keyed by (dataset fingerprint, filter key).
+    
+    Bounded by the estimated memory of the results it holds. Concurrent misses
+    on the same key compute the result once; the other callers wait for it.
+    """
+    def __init__(self, max_bytes=RESULT_CACHE_MB << 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Return a cached result and mark it as recently used"""
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+    
+    def put(self, key, value):
+        """Store a result, evicting the least recently used entries to stay within budget.
+        
+        A result larger than the whole budget is not stored.
+        """
+        size = estimate_nbytes(value)
+        with self.lock:
+            self._store(key, value, size)
+    
+    def _store(self, key, value, size):
+        if key in self.entries:
+            self.nbytes -= self.sizes.pop(key)
+            del self.entries[key]
+        if size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            evicted, _ = self.entries.popitem(last=False)
+            self.nbytes -= self.sizes.pop(evicted)
+    
+    def get_or_compute(self, key, compute):
+        """Return a cached result, computing and storing it on a miss.
+        
+        Only the first caller to miss runs compute; callers arriving while it
+        runs wait for its result, or its exception.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            pending = self.pending.get(key)
+            computing = pending is None
+            if computing:
+                pending = self.pending[key] = Future()
+        if not computing:
+            return pending.result()
+        
+        try:
+            value = compute()
+            size = estimate_nbytes(value)
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            pending.set_exception(e)
+            raise
+        with self.lock:
+            self._store(key, value, size)
+            del self.pending[key]
+        pending.set_result(value)
+        return value
+
+# Results shared by every session and the JSON API within one process
+RESULT_CACHE = ResultCache()
+
+class PrecomputeWorker:
+    """Run dashboard computations in the background and hand back results by name"""
+    def __init__(self, executor):
+        self.executor = executor
+        self.futures = {}
+    
+    def submit(self, name, fn, *args, **kwargs):
+        """Schedule a computation; jobs start in the order they are submitted"""
+        self.futures[name] = self.executor.submit(fn, *args, **kwargs)
+        return self.futures[name]
+    
+    def submit_after(self, name, dependency, fn, *args):
+        """Schedule a computation on another's result, passed as its last argument.
+        
+        The job is queued only once the dependency has finished, so waiting for it
+        never holds a worker thread.
+        """
+        chained = Future()
+        self.futures[name] = chained
+        
+        def run(upstream):
+            if not chained.set_running_or_notify_cancel():
+                return
+            try:
+                chained.set_result(fn(*args, upstream.result()))
+            except BaseException as e:
+                chained.set_exception(e)
+        
+        def start(upstream):
+            if upstream.cancelled():
+                chained.cancel()
+            else:
+                self.executor.submit(run, upstream)
+        
+        self.futures[dependency].add_done_callback(start)
+        return chained
+    
+    def result(self, name):
+        """Wait for a computation to finish and return its result"""
+        return self.futures[name].result()
+    
+    def ready(self, name):
+        """Check whether a computation has finished"""
+        return name in self.futures and self.futures[name].done()
+    
+    def cancel(self):
+        """Drop computations that have not started yet"""
+        for future in self.futures.values():
+            future.cancel()
@@ -1,10 +1,26 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import io
+import os
+import tempfile
+import zipfile
 import warnings
+from pmtct_core import (
+    PMTCTDashboard, AggregationTree, PrecomputeWorker, RESULT_CACHE,
+    CASCADE_CHARTS, INDICATOR_RATIOS, KPI_STRIP, ORG_UNIT_LEVELS, REPORTING_RATE_COLUMNS,
+    get_quarter_from_month, extract_year_from_period, filter_frame, describe_selection,
+    compute_ratio_frame, dataset_fingerprint, canonical_filter_key,
+    facility_coverage, bin_scatter_points, coverage_histogram, coverage_box_stats,
+    load_extract_bundle, zip_extract_sources, directory_extract_sources, directory_signature,
+    EXTRACT_ROOT, resolve_extract_directory,
+    read_csv_checked, read_json_checked,
+    FILTER_PARAMS, encode_filter_params, decode_filter_params,
+    LAGGED_RATIOS, LaggedCascade, period_months,
+    CUBE_DIMENSIONS, BOUNDARY_DIR, BOUNDARY_FILES, boundary_file, load_boundary_layer, map_zoom,
+    ReportingCompleteness, MISSING_STREAK_ALERT, MAX_HEATMAP_FACILITIES
+)
 warnings.filterwarnings('ignore')
 
 # Set page configuration
@@ -134,446 +150,376 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class PMTCTDashboard:
-    def __init__(self, data):
-        self.data = data
-        self.clean_data()
-    
-    def clean_data(self):
-        """Clean and preprocess the data"""
-        # Replace empty strings with NaN
-        self.data = self.data.replace('', np.nan)
-        
-        # Convert all columns to numeric where possible
-        for col in self.data.columns:
-            if col not in ['periodname', 'orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3', 
-                          'organisationunitname', 'organisationunitcode', 'perioddescription',
-                          'periodid', 'periodcode']:
-                self.data[col] = pd.to_numeric(self.data[col], errors='coerce').fillna(0)
-    
-    def safe_sum(self, column_name):
-        """Safely sum a column, returning 0 if column doesn't exist"""
-        if column_name in self.data.columns:
-            return self.data[column_name].sum()
-        return 0
-    
-    def calculate_percentage(self, numerator, denominator):
-        """Calculate percentage safely"""
-        if denominator > 0:
-            return (numerator / denominator) * 100
-        return 0
-    
-    def create_comparison_chart(self, title, numerator_col, denominator_col, numerator_label, denominator_label):
-        """Create a comparison chart with percentage calculation"""
-        numerator = self.safe_sum(numerator_col)
-        denominator = self.safe_sum(denominator_col)
-        percentage = self.calculate_percentage(numerator, denominator)
-        
-        fig = go.Figure()
-        
-        # Add bars
-        fig.add_trace(go.Bar(
-            x=[denominator_label, numerator_label],
-            y=[denominator, numerator],
-            marker_color=['#008751', '#87CEEB'],
-            text=[f'{denominator:,}', f'{numerator:,}'],
-            textposition='auto',
-            textfont=dict(size=24, color='black', family="Arial Black")  # Much larger text in charts
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>{title}</b><br><sub>Coverage: {percentage:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")  # Larger chart titles
-            ),
-            showlegend=False,
-            height=500,
-            font=dict(size=18, family="Arial"),  # Larger axis labels
-            xaxis=dict(
-                tickfont=dict(size=18, family="Arial Black"),  # Larger x-axis labels
-                title_font=dict(size=20, family="Arial Black")  # Larger x-axis title
-            ),
-            yaxis=dict(
-                tickfont=dict(size=18, family="Arial Black"),  # Larger y-axis labels
-                title_font=dict(size=20, family="Arial Black")  # Larger y-axis title
+@st.cache_resource
+def get_precompute_executor():
+    """Thread pool shared by all sessions for background precomputation"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix='pmtct-precompute')
+
+def start_precompute(dashboard, filtered_df, cache_key):
+    """Start building aggregates, charts and the export file for the filtered data"""
+    # A rerun supersedes whatever the previous run of this session still had queued
+    previous = st.session_state.get('precompute_worker')
+    if previous is not None:
+        previous.cancel()
+    
+    worker = PrecomputeWorker(get_precompute_executor())
+    st.session_state['precompute_worker'] = worker
+    
+    def submit_cached(name, fn, *args):
+        """Submit a job whose result is shared by every session viewing the same data and filters"""
+        return worker.submit(name, RESULT_CACHE.get_or_compute, (name,) + cache_key, partial(fn, *args))
+    
+    def submit_cached_after(name, dependency, fn):
+        """Submit a shared job that takes another job's result, queued once that result is ready"""
+        return worker.submit_after(name, dependency,
+                                   lambda result: RESULT_CACHE.get_or_compute((name,) + cache_key, partial(fn, result)))
+    
+    # Charts in page order so the top sections are ready first
+    for name in CASCADE_CHARTS:
+        submit_cached(name, dashboard.build_cascade_chart, name)
+    submit_cached('reporting_trend', dashboard.create_reporting_trend)
+    
+    # Aggregates feeding the summary section, chained on the cube so no thread sits waiting for it
+    submit_cached('cube', dashboard.build_aggregate_cube)
+    submit_cached_after('trend_matrix', 'cube', dashboard.build_trend_matrix)
+    submit_cached_after('league_table', 'cube', dashboard.build_league_table)
+    submit_cached_after('aggregation_tree', 'cube', AggregationTree)
+    submit_cached_after('completeness', 'cube', ReportingCompleteness)
+    # The export is the size of the filtered data, too large to keep per filter
+    worker.submit('export_csv', filtered_df.to_csv, index=False)
+    
+    return worker
+
+@st.cache_data(show_spinner="Reading data...")
+def load_file_upload(name, content):
+    """Cleaned dataset, schema report and fingerprint from an uploaded CSV or JSON export"""
+    if name.lower().endswith('.json'):
+        # Streams the export and pivots it to the CSV layout without loading the whole document
+        data, schema_report = read_json_checked(io.BytesIO(content))
+    else:
+        # Rejects the wrong export from its header and first rows, before the full parse
+        data, schema_report = read_csv_checked(io.BytesIO(content))
+    data = PMTCTDashboard(data).data
+    return data, schema_report, dataset_fingerprint(data)
+
+@st.cache_data(show_spinner="Parsing extracts in parallel...")
+def load_zip_upload(content):
+    """Cleaned dataset, schema report and fingerprint from an uploaded ZIP bundle of extracts"""
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = os.path.join(tmp, 'extracts.zip')
+        with open(zip_path, 'wb') as f:
+            f.write(content)
+        data, schema_report = load_extract_bundle(zip_extract_sources(zip_path))
+    return data, schema_report, dataset_fingerprint(data)
+
+@st.cache_data(show_spinner="Parsing extracts in parallel...")
+def load_extract_directory(directory, signature):
+    """Cleaned dataset, schema report and fingerprint from a folder of extracts; the signature changes when any file does"""
+    data, schema_report = load_extract_bundle(directory_extract_sources(directory))
+    return data, schema_report, dataset_fingerprint(data)
+
+def get_aggregate_cube(data, fingerprint):
+    """Aggregate cube for a cleaned dataset, shared by every session and rerun that sees the same data.
+    
+    Held once in RESULT_CACHE under the dataset fingerprint, so the data is not
+    hashed and the cube is not copied on every rerun. Callers must not modify it.
+    """
+    return RESULT_CACHE.get_or_compute(('full_cube', fingerprint),
+                                       PMTCTDashboard(data, clean=False).build_aggregate_cube)
+
+def restore_url_filters(fingerprint, options):
+    """Filter defaults from the page's query parameters.
+    
+    Read once per session and dataset, so the widget defaults stay fixed while
+    the user edits the filters and the URL follows their edits.
+    """
+    restored = st.session_state.get('url_filters')
+    if restored is None or restored[0] != fingerprint:
+        params = {key: st.query_params.get_all(key) for key in st.query_params}
+        restored = (fingerprint, decode_filter_params(params, options))
+        st.session_state['url_filters'] = restored
+    return restored[1]
+
+def url_filter_default(url_filters, col, options):
+    """Widget default for one filter: the shared link's values, or every option"""
+    restored = url_filters.get(col)
+    if restored is None:
+        return options
+    allowed = set(options)
+    return [value for value in restored if value in allowed]
+
+def share_url_filters(selection, options):
+    """Mirror the current filters into the query parameters so the page URL can be shared"""
+    params = encode_filter_params(selection, options)
+    current = {key: st.query_params.get_all(key) for key in st.query_params}
+    if params != current:
+        st.query_params.from_dict(params)
+
+@st.cache_resource(show_spinner="Loading boundaries...")
+def get_boundary_layer(path, mtime, level):
+    """Boundaries for one org unit level, shared by all sessions along with their simplified geometries"""
+    return load_boundary_layer(path, level)
+
+def comparison_selection_widgets(cube, label):
+    """Sidebar widgets for one side of the comparison; empty selections mean all data"""
+    st.sidebar.markdown(f"**Selection {label}**")
+    selection = {}
+    for col, title in [('periodname', "Month(s)"), ('orgunitlevel1', "State(s)"), ('orgunitlevel2', "LGA(s)")]:
+        if col in cube.columns:
+            options = sorted(cube[col].dropna().unique())
+            selection[col] = st.sidebar.multiselect(
+                f"{title} for {label}",
+                options,
+                key=f"compare_{label}_{col}",
+                help="Leave empty to include everything"
             )
-        )
-        
-        return fig, percentage, numerator, denominator
+    return selection
+
+def render_comparison(dashboard, cube, selection_a, selection_b):
+    """Render every cascade for two selections side by side, with their deltas"""
+    label_a = describe_selection(selection_a)
+    label_b = describe_selection(selection_b)
+    
+    st.markdown("### 🔀 COMPARISON MODE")
+    
+    ratios, counts, records = dashboard.compare_selections(cube, selection_a, selection_b)
+    st.markdown(f"**A:** {label_a} ({records['A']:,} records)  \n**B:** {label_b} ({records['B']:,} records)")
+    
+    # KPI strip shows selection B with its change from A
+    for col, name in zip(st.columns(len(KPI_STRIP)), KPI_STRIP):
+        with col:
+            st.metric(name, f"{ratios.loc[name, 'B (%)']:.1f}%",
+                      delta=f"{ratios.loc[name, 'Change (pp)']:+.1f} pp")
+    
+    with st.expander("📊 Coverage Deltas (percentage points)", expanded=True):
+        st.dataframe(ratios, use_container_width=True)
+    
+    with st.expander("🔢 Indicator Deltas (absolute)"):
+        st.dataframe(counts, use_container_width=True)
+    
+    # Both sides are slices of the same cube, so no raw data is re-filtered
+    view_a = PMTCTDashboard(filter_frame(cube, selection_a), clean=False)
+    view_b = PMTCTDashboard(filter_frame(cube, selection_b), clean=False)
+    
+    for name, (heading, _, _) in CASCADE_CHARTS.items():
+        st.markdown("---")
+        st.markdown(f'<div class="section-header">{heading}</div>', unsafe_allow_html=True)
+        col1, col2 = st.columns(2)
+        for col, view, label in [(col1, view_a, "A"), (col2, view_b, "B")]:
+            with col:
+                result = view.build_cascade_chart(name)
+                fig = result[0] if isinstance(result, tuple) else result
+                st.markdown(f"**Selection {label}**")
+                st.plotly_chart(fig, use_container_width=True, key=f"compare_{name}_{label}")
+
+def render_lagged_cascade(dashboard, full_cube, fingerprint, selection):
+    """Cascade ratios against the denominator from earlier months, next to the same-period ratio"""
+    levels = [col for col in ORG_UNIT_LEVELS if col in full_cube.columns]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        ratio_name = st.selectbox("Cascade", list(LAGGED_RATIOS), key='lag_ratio')
+    with col2:
+        lag = st.slider("Lag (months)", 0, 6, 1, key='lag_months',
+                        help="Compare each month's numerator with the denominator this many months earlier")
+    with col3:
+        window = st.slider("Denominator Months", 1, 3, 1, key='lag_window',
+                           help="Average the lagged denominator over this many months")
+    with col4:
+        level = st.selectbox("Compare By", levels, format_func=ORG_UNIT_LEVELS.get, key='lag_level') if levels else None
     
-    def create_anc_hiv_testing_chart(self):
-        """Create ANC HIV testing coverage chart"""
-        anc_clients = self.safe_sum('PMTCT_ANC_1 Number of New ANC clients')
-        hiv_tested_anc = self.safe_sum('PMTCT_HTS_6 Number of  pregnant women HIV tested and received results ANC')
-        testing_rate = self.calculate_percentage(hiv_tested_anc, anc_clients)
-        
-        fig = go.Figure()
-        
-        categories = ['ANC Clients', 'HIV Tested (ANC)']
-        values = [anc_clients, hiv_tested_anc]
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#87CEEB'],
-            text=[f'{anc_clients:,}', f'{hiv_tested_anc:,}'],
-            textposition='auto',
-            textfont=dict(size=24, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>ANC HIV Testing Coverage</b><br><sub>Testing Rate: {testing_rate:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            )
-        )
-        
-        return fig, testing_rate
+    # Built from every period so the first selected month can still look back
+    org_selection = {col: values for col, values in selection.items() if col != 'periodname'}
+    cascade = RESULT_CACHE.get_or_compute(
+        ('lagged_cascade', fingerprint, canonical_filter_key(org_selection), level),
+        lambda: LaggedCascade(filter_frame(full_cube, org_selection), level)
+    )
+    if cascade.empty:
+        st.info("No monthly periods (e.g. 'January 2024') available for lagged ratios")
+        return
+    
+    months = period_months(selection['periodname']) if selection.get('periodname') else None
+    lag_label = f"Lagged {lag} Month(s)" + (f", {window}-Month Average" if window > 1 else "")
+    same_period = cascade.national(ratio_name, 0, 1, months)
+    lagged = cascade.national(ratio_name, lag, window, months)
+    st.plotly_chart(dashboard.create_lagged_cascade_chart(same_period, lagged, ratio_name, lag_label),
+                    use_container_width=True)
+    
+    # Average month-to-month change, the swing the lag is meant to smooth out
+    swing_same = same_period.diff().abs().mean()
+    swing_lagged = lagged.diff().abs().mean()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Monthly Swing: Same Period", f"{swing_same:.1f} pp" if pd.notna(swing_same) else "n/a")
+    with col2:
+        st.metric(f"Monthly Swing: {lag_label}", f"{swing_lagged:.1f} pp" if pd.notna(swing_lagged) else "n/a",
+                  delta=f"{swing_lagged - swing_same:+.1f} pp" if pd.notna(swing_same) and pd.notna(swing_lagged) else None,
+                  delta_color="inverse")
+    
+    with st.expander(f"📋 {ratio_name} by {ORG_UNIT_LEVELS.get(level, 'Org Unit')}"):
+        table = pd.DataFrame({
+            "Same Period (%)": cascade.unit_summary(ratio_name, 0, 1, months),
+            f"{lag_label} (%)": cascade.unit_summary(ratio_name, lag, window, months),
+        })
+        table["Change (pp)"] = table.iloc[:, 1] - table.iloc[:, 0]
+        st.dataframe(table.round(1), use_container_width=True)
+    
+    with st.expander("⏱️ Lag Profile"):
+        st.dataframe(cascade.lag_profile(ratio_name, max(lag, 3), window, months).round(1), use_container_width=True)
+
+def render_drilldown(dashboard, tree):
+    """Bar chart of one ratio across the org units below the current node; clicking a bar drills in"""
+    path = st.session_state.get('drill_path', [])
+    if not tree.has_node(path):
+        path = []
     
-    def create_anc_treatment_cascade(self):
-        """Create ANC treatment cascade"""
-        hiv_positive_anc = self.safe_sum('PMTCT_HTS_7. Number of pregnant women tested HIV positive_ ANC')
-        art_early = self.safe_sum('PMTCT_ART_15b. Number of HIV positive pregnant women newly started on  ART during ANC  <36wks of pregnancy')
-        art_late = self.safe_sum('PMTCT_ART_15c. Number of HIV positive pregnant women newly started on  ART during ANC >36wks of pregnancy')
-        
-        total_art_anc = art_early + art_late
-        
-        # Calculate percentages
-        art_early_percentage = self.calculate_percentage(art_early, hiv_positive_anc)
-        art_late_percentage = self.calculate_percentage(art_late, hiv_positive_anc)
-        total_art_percentage = self.calculate_percentage(total_art_anc, hiv_positive_anc)
-        
-        fig = go.Figure()
-        
-        categories = ['HIV Positive (ANC)', 'ART <36wks', 'ART >36wks', 'Total ART']
-        values = [hiv_positive_anc, art_early, art_late, total_art_anc]
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#28a745', '#ffc107', '#dc3545'],
-            text=[f'{val:,}' for val in values],
-            textposition='auto',
-            textfont=dict(size=22, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>ANC Treatment Cascade</b><br><sub>Total ART Coverage: {total_art_percentage:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=18, family="Arial Black"),
-                title_font=dict(size=20, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=18, family="Arial Black"),
-                title_font=dict(size=20, family="Arial Black")
-            )
-        )
-        
-        return fig, total_art_percentage, art_early_percentage, art_late_percentage
+    indicator = st.selectbox("Indicator", list(INDICATOR_RATIOS), key='drill_indicator')
     
-    def create_ld_cascade(self):
-        """Create Labour & Delivery cascade"""
-        hiv_tested_ld = self.safe_sum('PMTCT_HTS_6 Number of  pregnant women HIV tested and received results L&D')
-        hiv_positive_ld = self.safe_sum('PMTCT_HTS_7. Number of pregnant women tested HIV positive_ L&D')
-        art_ld = self.safe_sum('PMTCT_ART_15d. Number of HIV positive pregnant women newly started on  ART during Labour')
-        
-        positivity_rate_ld = self.calculate_percentage(hiv_positive_ld, hiv_tested_ld) if hiv_tested_ld > 0 else 0
-        art_coverage_ld = self.calculate_percentage(art_ld, hiv_positive_ld) if hiv_positive_ld > 0 else 0
-        
-        fig = go.Figure()
-        
-        categories = ['L&D Tested', 'L&D Positive', 'L&D ART']
-        values = [hiv_tested_ld, hiv_positive_ld, art_ld]
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#ffc107', '#dc3545'],
-            text=[f'{val:,}' for val in values],
-            textposition='auto',
-            textfont=dict(size=24, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>Labour & Delivery Cascade</b><br><sub>Positivity: {positivity_rate_ld:.1f}% | ART Coverage: {art_coverage_ld:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            )
-        )
-        
-        return fig, positivity_rate_ld, art_coverage_ld
+    parent_label = ' › '.join(['National'] + [str(name) for name in path])
+    st.markdown(f"**📍 {parent_label}**")
     
-    def create_previously_known_chart(self):
-        """Create previously known HIV positive chart"""
-        known_positive = self.safe_sum('PMTCT_HTS_5. Number of pregnant women with previously known HIV positive infection')
-        already_on_art = self.safe_sum('PMTCT_ART_15a. Number of HIV positive pregnant women already on ART prior to this pregnancy')
-        
-        art_coverage_known = self.calculate_percentage(already_on_art, known_positive) if known_positive > 0 else 0
-        
-        fig = go.Figure()
-        
-        categories = ['Previously Known HIV+', 'Already on ART']
-        values = [known_positive, already_on_art]
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#28a745'],
-            text=[f'{val:,}' for val in values],
-            textposition='auto',
-            textfont=dict(size=24, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>Previously Known HIV+ Women</b><br><sub>ART Coverage: {art_coverage_known:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            )
-        )
-        
-        return fig, art_coverage_known
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("⬆️ Up One Level", disabled=not path, use_container_width=True):
+            st.session_state['drill_path'] = path[:-1]
+            st.rerun()
+    with col2:
+        if st.button("🏠 Back to National", disabled=not path, use_container_width=True):
+            st.session_state['drill_path'] = []
+            st.rerun()
     
-    def create_hub_spoke_referral(self):
-        """Create hub and spoke referral chart"""
-        referred = self.safe_sum('PMTCT_ART_15h. Number of Pregnant women referred to a Hub facility for treatment')
-        initiated = self.safe_sum('PMTCT_ADDENDUM_15h Number of HIV positive pregnant women  identified in the spoke site who were initiated on ART in the comprehensive site')
-        
-        completion_rate = self.calculate_percentage(initiated, referred) if referred > 0 else 0
-        
-        fig = go.Figure()
-        
-        categories = ['Referred to Hub', 'Initiated at Hub']
-        values = [referred, initiated]
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#87CEEB'],
-            text=[f'{val:,}' for val in values],
-            textposition='auto',
-            textfont=dict(size=24, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>Hub & Spoke Referral System</b><br><sub>Completion Rate: {completion_rate:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=20, family="Arial Black"),
-                title_font=dict(size=22, family="Arial Black")
-            )
-        )
-        
-        return fig, completion_rate
+    child_level = tree.child_level(path)
+    if child_level is None:
+        # Facility level: nothing further to drill into, show the node itself
+        ratios = dashboard.compute_ratios(tree.totals(path))
+        st.dataframe(pd.Series(ratios, name="Coverage (%)").round(1), use_container_width=True)
+        return
+    
+    ratios = compute_ratio_frame(tree.children(path))[indicator]
+    fig = dashboard.create_drilldown_chart(ratios, indicator, ORG_UNIT_LEVELS[child_level], parent_label)
+    event = st.plotly_chart(
+        fig,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="points",
+        key="drilldown_" + "/".join(str(name) for name in path)
+    )
     
-    def create_eid_chart(self):
-        """Create EID results chart"""
-        samples_taken = self.safe_sum('PMTCT_EID_33. No. of of HEI whose samples were taken within 2 months of birth for DNA PCR')
-        negative_results = self.safe_sum('PMTCT_EID_33. No. of HIV PCR results received for babies whose samples were taken for DNA PCR_Negative')
-        positive_results = self.safe_sum('PMTCT_EID_33. No. of HIV PCR results received for babies whose samples were taken for DNA PCR_Positive')
-        
-        total_results = negative_results + positive_results
-        result_coverage = self.calculate_percentage(total_results, samples_taken)
-        positivity_rate = self.calculate_percentage(positive_results, total_results) if total_results > 0 else 0
-        
-        fig = go.Figure()
-        
-        categories = ['Samples Taken', 'Results Received', 'Negative', 'Positive']
-        values = [samples_taken, total_results, negative_results, positive_results]
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#87CEEB', '#28a745', '#dc3545'],
-            text=[f'{val:,}' for val in values],
-            textposition='auto',
-            textfont=dict(size=22, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text=f"<b>EID Cascade</b><br><sub>Result Coverage: {result_coverage:.1f}% | Positivity: {positivity_rate:.1f}%</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=18, family="Arial Black"),
-                title_font=dict(size=20, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=18, family="Arial Black"),
-                title_font=dict(size=20, family="Arial Black")
-            )
-        )
-        
-        return fig, result_coverage, positivity_rate
-    
-    def create_comprehensive_art_chart(self):
-        """Create comprehensive ART chart including postpartum"""
-        art_early = self.safe_sum('PMTCT_ART_15b. Number of HIV positive pregnant women newly started on  ART during ANC  <36wks of pregnancy')
-        art_late = self.safe_sum('PMTCT_ART_15c. Number of HIV positive pregnant women newly started on  ART during ANC >36wks of pregnancy')
-        art_labour = self.safe_sum('PMTCT_ART_15d. Number of HIV positive pregnant women newly started on  ART during Labour')
-        art_postpartum = self.safe_sum('PMTCT_ART_15e. Number of HIV positive pregnant women newly started on  ART during Post Partum (<72 hrs)')
-        art_already = self.safe_sum('PMTCT_ART_15a. Number of HIV positive pregnant women already on ART prior to this pregnancy')
-        
-        total_new_art = art_early + art_late + art_labour + art_postpartum
-        total_art = total_new_art + art_already
-        
-        categories = ['Already on ART', 'ART <36wks', 'ART >36wks', 'ART Labour', 'ART Postpartum', 'Total New ART', 'Total ART']
-        values = [art_already, art_early, art_late, art_labour, art_postpartum, total_new_art, total_art]
-        
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            x=categories,
-            y=values,
-            marker_color=['#008751', '#28a745', '#ffc107', '#dc3545', '#6f42c1', '#17a2b8', '#20c997'],
-            text=[f'{val:,}' for val in values],
-            textposition='auto',
-            textfont=dict(size=20, color='black', family="Arial Black")
-        ))
-        
-        fig.update_layout(
-            title=dict(
-                text="<b>Comprehensive ART Initiation</b><br><sub>All Treatment Categories</sub>",
-                font=dict(size=26, color='black', family="Arial Black")
-            ),
-            height=500,
-            showlegend=False,
-            font=dict(size=18, family="Arial"),
-            xaxis=dict(
-                tickfont=dict(size=16, family="Arial Black"),
-                title_font=dict(size=18, family="Arial Black")
-            ),
-            yaxis=dict(
-                tickfont=dict(size=16, family="Arial Black"),
-                title_font=dict(size=18, family="Arial Black")
-            )
-        )
-        
-        return fig
-    
-    def create_reporting_trend(self):
-        """Create reporting rate trend chart"""
-        if 'periodname' in self.data.columns:
-            reporting_data = self.data.groupby('periodname').agg({
-                'PMTCT MSF Comprehensive - Reporting rate': 'mean',
-                'PMTCT MSF FOR SPOKE SITES   - Reporting rate': 'mean'
-            }).reset_index()
-            
-            fig = go.Figure()
-            
-            fig.add_trace(go.Scatter(
-                x=reporting_data['periodname'],
-                y=reporting_data['PMTCT MSF Comprehensive - Reporting rate'],
-                mode='lines+markers',
-                name='Comprehensive Sites',
-                line=dict(color='#008751', width=4)
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=reporting_data['periodname'],
-                y=reporting_data['PMTCT MSF FOR SPOKE SITES   - Reporting rate'],
-                mode='lines+markers',
-                name='Spoke Sites',
-                line=dict(color='#FFD700', width=4)
-            ))
-            
-            # Add 90% threshold line
-            fig.add_hline(y=90, line_dash="dash", line_color="red", annotation_text="90% Target")
-            
-            fig.update_layout(
-                title=dict(
-                    text="<b>Reporting Rate Trends</b>",
-                    font=dict(size=26, color='black', family="Arial Black")
-                ),
-                xaxis_title="Period",
-                yaxis_title="Reporting Rate (%)",
-                height=500,
-                font=dict(size=18, family="Arial"),
-                legend=dict(font=dict(size=16, family="Arial Black")),
-                xaxis=dict(
-                    tickfont=dict(size=16, family="Arial Black"),
-                    title_font=dict(size=18, family="Arial Black")
-                ),
-                yaxis=dict(
-                    tickfont=dict(size=16, family="Arial Black"),
-                    title_font=dict(size=18, family="Arial Black")
-                )
-            )
-            
-            return fig
-        return None
+    points = event.selection.points if event else []
+    if points:
+        names = {str(name): name for name in ratios.index}
+        st.session_state['drill_path'] = path + [names[points[0]['x']]]
+        st.rerun()
 
-def get_quarter_from_month(month_name):
-    """Convert month name to quarter"""
-    month_to_quarter = {
-        'January': 'Quarter 1', 'February': 'Quarter 1', 'March': 'Quarter 1',
-        'April': 'Quarter 2', 'May': 'Quarter 2', 'June': 'Quarter 2',
-        'July': 'Quarter 3', 'August': 'Quarter 3', 'September': 'Quarter 3',
-        'October': 'Quarter 4', 'November': 'Quarter 4', 'December': 'Quarter 4'
-    }
-    return month_to_quarter.get(month_name, 'Unknown Quarter')
+def render_facility_distribution(dashboard, tree):
+    """Scatter, histogram and box plots of one ratio across every facility, sent binned"""
+    if not tree.levels:
+        st.info("No org unit columns available for facility-level views")
+        return
+    
+    ratio_name = st.selectbox("Coverage Indicator", list(INDICATOR_RATIOS), key='distribution_indicator')
+    unit_label = ORG_UNIT_LEVELS[tree.levels[-1]]
+    coverage = facility_coverage(tree.level_frame(len(tree.levels)), ratio_name)
+    if coverage.empty:
+        st.info(f"No {unit_label.lower()} reported the denominator for {ratio_name}")
+        return
+    
+    points = bin_scatter_points(coverage)
+    fig_scatter = dashboard.create_facility_scatter(points, ratio_name, "Denominator Volume", len(coverage))
+    st.plotly_chart(fig_scatter, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        counts, edges = coverage_histogram(coverage)
+        st.plotly_chart(dashboard.create_coverage_histogram(counts, edges, ratio_name), use_container_width=True)
+    
+    with col2:
+        if len(tree.levels) > 1:
+            stats = coverage_box_stats(coverage)
+            fig_box = dashboard.create_coverage_box(stats, ratio_name, ORG_UNIT_LEVELS[tree.levels[0]])
+            st.plotly_chart(fig_box, use_container_width=True)
 
-def extract_year_from_period(period_name):
-    """Extract year from period name"""
-    # Handle different period formats
-    if isinstance(period_name, str):
-        # Look for 4-digit years
-        import re
-        year_match = re.search(r'20\d{2}', period_name)
-        if year_match:
-            return year_match.group()
-    return 'Unknown Year'
+def render_choropleth(dashboard, cube, selection):
+    """State or LGA map of one coverage ratio, drawn from boundaries simplified for the zoom level"""
+    levels = [col for col in BOUNDARY_FILES if col in cube.columns]
+    if not levels:
+        st.info("No state or LGA columns available for the map")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        ratio_name = st.selectbox("Map Indicator", list(INDICATOR_RATIOS), key='map_indicator')
+    with col2:
+        level = st.radio("Map Level", levels, format_func=ORG_UNIT_LEVELS.get, horizontal=True, key='map_level')
+    
+    path = boundary_file(level)
+    if path is None:
+        st.info(f"Add {BOUNDARY_FILES[level]} to {BOUNDARY_DIR} to show the {ORG_UNIT_LEVELS[level]} map")
+        return
+    layer = get_boundary_layer(path, os.path.getmtime(path), level)
+    
+    # LGAs are grouped with their state, since LGA names repeat across states
+    keys = [col for col in ['orgunitlevel1', level] if col in cube.columns] if level != 'orgunitlevel1' else [level]
+    other_dimensions = [col for col in CUBE_DIMENSIONS if col in cube.columns and col not in keys]
+    ratios = compute_ratio_frame(cube.drop(columns=other_dimensions).groupby(keys).sum())[ratio_name]
+    
+    areas = [key if isinstance(key, tuple) else (None, key) for key in ratios.index]
+    feature_ids = layer.match_areas([(name, parent) for parent, name in areas])
+    on_map = [feature_id is not None for feature_id in feature_ids]
+    
+    zoom = map_zoom(selection)
+    matched_ids = [feature_id for feature_id in feature_ids if feature_id is not None]
+    fig = dashboard.create_choropleth_map(
+        layer.subset(zoom, matched_ids),
+        matched_ids,
+        ratios.values[on_map],
+        [str(name) for (_, name), found in zip(areas, on_map) if found],
+        ratio_name,
+        ORG_UNIT_LEVELS[level]
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    missing = [str(name) for (_, name), found in zip(areas, on_map) if not found]
+    if missing:
+        with st.expander(f"⚠️ {len(missing)} {ORG_UNIT_LEVELS[level]}(s) not found in the boundary file"):
+            st.write(', '.join(missing))
+
+def render_completeness(dashboard, completeness):
+    """Which facilities reported in which period: rates, missing streaks and a heatmap"""
+    if completeness.empty:
+        st.info("Facility and period columns are needed for the completeness matrix")
+        return
+    
+    facilities = completeness.facility_table()
+    latest = completeness.periods[-1]
+    flagged = facilities[facilities['Current Missing Streak'] >= MISSING_STREAK_ALERT]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Reporting Completeness", f"{facilities['Completeness (%)'].mean():.1f}%")
+    with col2:
+        st.metric(f"Reported in {latest}", f"{completeness.period_rates().iloc[-1]:.1f}%")
+    with col3:
+        st.metric(f"Missed Last {MISSING_STREAK_ALERT}+ Periods", f"{len(flagged):,} facilities")
+    
+    # Least complete first, longest current gap breaking ties
+    ranked = facilities.reset_index(drop=True).sort_values(
+        ['Completeness (%)', 'Current Missing Streak'], ascending=[True, False]
+    )
+    shown = ranked.index[:MAX_HEATMAP_FACILITIES].to_numpy()
+    labels = [' / '.join(str(name) for name in completeness.facilities[position][-2:]) for position in shown]
+    fig = dashboard.create_completeness_heatmap(completeness.matrix(shown), labels, completeness.periods,
+                                                len(facilities))
+    st.plotly_chart(fig, use_container_width=True)
+    
+    lga_rates = completeness.unit_rates('orgunitlevel2')
+    if lga_rates is not None:
+        with st.expander("🏙️ Completeness by LGA"):
+            st.dataframe(lga_rates.round(1), use_container_width=True)
+    
+    if not flagged.empty:
+        with st.expander(f"🚩 Facilities Missing the Last {MISSING_STREAK_ALERT}+ Periods"):
+            st.dataframe(flagged.sort_values('Current Missing Streak', ascending=False).round(1),
+                         use_container_width=True)
 
 def main():
     # Header with Nigerian theme and logos
@@ -589,12 +535,42 @@ def main():
     
     # File upload
     st.sidebar.markdown("### 📁 DATA UPLOAD")
-    uploaded_file = st.sidebar.file_uploader("Upload PMTCT Data CSV File", type=['csv'])
+    uploaded_file = st.sidebar.file_uploader(
+        "Upload PMTCT Data CSV/JSON File or ZIP of Extracts",
+        type=['csv', 'json', 'zip'],
+        help="Upload one NDARS export (CSV, or DHIS2 analytics/dataValueSets JSON), "
+             "or a ZIP of per-state extracts with the same columns"
+    )
+    # Only folders under the operator's extract root can be read from the server
+    extract_directory = st.sidebar.text_input(
+        "...or Folder of CSV Extracts",
+        help="Folder of per-state extracts, relative to the server's extract folder"
+    ) if EXTRACT_ROOT else None
+    
+    # Every loader returns cleaned data with its schema report and fingerprint, cached until the data changes
+    try:
+        if uploaded_file is not None and uploaded_file.name.lower().endswith('.zip'):
+            df, schema_report, fingerprint = load_zip_upload(uploaded_file.getvalue())
+        elif uploaded_file is not None:
+            df, schema_report, fingerprint = load_file_upload(uploaded_file.name, uploaded_file.getvalue())
+        elif extract_directory:
+            directory = resolve_extract_directory(extract_directory, EXTRACT_ROOT)
+            df, schema_report, fingerprint = load_extract_directory(directory, directory_signature(directory))
+        else:
+            df = None
+    except (ValueError, OSError, zipfile.BadZipFile) as e:
+        st.sidebar.error(f"❌ Could not load data: {e}")
+        st.stop()
     
-    if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file)
+    if df is not None:
         st.sidebar.success(f"✅ Data loaded successfully: {len(df)} records")
         
+        if not schema_report.complete:
+            with st.sidebar.expander(f"⚠️ Schema Check: {len(schema_report.messages())} issue(s)",
+                                     expanded=bool(schema_report.missing)):
+                for message in schema_report.messages():
+                    st.write(f"- {message}")
+        
         # Show available columns for verification
         with st.sidebar.expander("🔍 Verify Columns"):
             st.write("Columns found:", len(df.columns))
@@ -603,7 +579,21 @@ def main():
         st.warning("⚠️ Please upload a CSV file to populate the dashboard")
         st.stop()
     
-    dashboard = PMTCTDashboard(df)
+    dashboard = PMTCTDashboard(df, clean=False)
+    full_data = dashboard.data
+    
+    # Filters opened from a shared link
+    filter_options = {col: sorted(list(df[col].unique())) for col in FILTER_PARAMS.values() if col in df.columns}
+    url_filters = restore_url_filters(fingerprint, filter_options)
+    
+    # COMPARISON MODE
+    st.sidebar.markdown("### 🔀 COMPARISON")
+    if st.sidebar.checkbox("Compare two selections", help="Compare two periods or regions side by side"):
+        cube = get_aggregate_cube(dashboard.data, fingerprint)
+        selection_a = comparison_selection_widgets(cube, "A")
+        selection_b = comparison_selection_widgets(cube, "B")
+        render_comparison(dashboard, cube, selection_a, selection_b)
+        return
     
     # FILTERS SECTION
     st.sidebar.markdown("### 🔍 FILTERS")
@@ -655,7 +645,7 @@ def main():
         selected_months = st.sidebar.multiselect(
             "Select Month(s)",
             filtered_months,
-            default=filtered_months,
+            default=url_filter_default(url_filters, 'periodname', filtered_months),
             help="Select one or multiple months to analyze"
         )
         
@@ -686,7 +676,7 @@ def main():
             selected_states = st.multiselect(
                 "Select State(s)", 
                 states,
-                default=states,
+                default=url_filter_default(url_filters, 'orgunitlevel1', states),
                 help="Select one or multiple states"
             )
             
@@ -701,7 +691,7 @@ def main():
             selected_lgas = st.multiselect(
                 "Select LGA(s)", 
                 lgas,
-                default=lgas,
+                default=url_filter_default(url_filters, 'orgunitlevel2', lgas),
                 help="Select one or multiple LGAs"
             )
             
@@ -715,7 +705,7 @@ def main():
         selected_facilities = st.sidebar.multiselect(
             "Select Health Facility(s)", 
             facilities,
-            default=facilities,
+            default=url_filter_default(url_filters, 'orgunitlevel3', facilities),
             help="Select one or multiple health facilities"
         )
         
@@ -747,6 +737,8 @@ def main():
     col1, col2 = st.sidebar.columns(2)
     with col1:
         if st.button("🔄 Clear Filters", use_container_width=True):
+            st.session_state['url_filters'] = (fingerprint, {})
+            st.query_params.clear()
             st.rerun()
     
     with col2:
@@ -763,49 +755,34 @@ def main():
     st.markdown("---")
     st.markdown("### 📊 KEY PERFORMANCE INDICATORS (COVERAGE %)")
     
-    # Calculate all coverage percentages
-    anc_clients = dashboard.safe_sum('PMTCT_ANC_1 Number of New ANC clients')
-    hiv_tested_anc = dashboard.safe_sum('PMTCT_HTS_6 Number of  pregnant women HIV tested and received results ANC')
-    hiv_tested_ld = dashboard.safe_sum('PMTCT_HTS_6 Number of  pregnant women HIV tested and received results L&D')
-    hbv_tested = dashboard.safe_sum('PMTCT_HTS_10. Number of new ANC Clients tested for HBV ( ANC, L&D, <72hrs Post Partum)')
-    hcv_tested = dashboard.safe_sum('PMTCT_HTS_11. Number of new ANC Clients tested for HCV ( ANC, L&D, <72hrs Post Partum)')
-    eid_samples = dashboard.safe_sum('PMTCT_EID_33. No. of of HEI whose samples were taken within 2 months of birth for DNA PCR')
-    
-    # Total HIV positive women (ANC + L&D + Previously known)
-    hiv_positive_anc = dashboard.safe_sum('PMTCT_HTS_7. Number of pregnant women tested HIV positive_ ANC')
-    hiv_positive_ld = dashboard.safe_sum('PMTCT_HTS_7. Number of pregnant women tested HIV positive_ L&D')
-    previously_known = dashboard.safe_sum('PMTCT_HTS_5. Number of pregnant women with previously known HIV positive infection')
-    total_hiv_positive = hiv_positive_anc + hiv_positive_ld + previously_known
-    
-    # Calculate coverage percentages
-    anc_testing_coverage = dashboard.calculate_percentage(hiv_tested_anc, anc_clients)
-    ld_testing_coverage = dashboard.calculate_percentage(hiv_tested_ld, anc_clients)
-    hbv_testing_coverage = dashboard.calculate_percentage(hbv_tested, anc_clients)
-    hcv_testing_coverage = dashboard.calculate_percentage(hcv_tested, anc_clients)
-    eid_coverage = dashboard.calculate_percentage(eid_samples, total_hiv_positive) if total_hiv_positive > 0 else 0
-    
-    col1, col2, col3, col4, col5 = st.columns(5)
-    
-    with col1:
-        st.metric("ANC HIV Testing", f"{anc_testing_coverage:.1f}%")
-    
-    with col2:
-        st.metric("L&D HIV Testing", f"{ld_testing_coverage:.1f}%")
-    
-    with col3:
-        st.metric("HBV Testing", f"{hbv_testing_coverage:.1f}%")
+    # Heavy aggregates and charts build in the background while the KPI strip
+    # renders from a single pass over the indicator totals
+    selection = {
+        'periodname': selected_months,
+        'orgunitlevel1': selected_states,
+        'orgunitlevel2': selected_lgas,
+        'orgunitlevel3': selected_facilities,
+    }
+    share_url_filters(selection, filter_options)
+    cache_key = (fingerprint, canonical_filter_key(selection))
+    worker = start_precompute(dashboard, filtered_df, cache_key)
+    worker.submit('full_cube', get_aggregate_cube, full_data, fingerprint)
+    totals = RESULT_CACHE.get_or_compute(('totals',) + cache_key, dashboard.indicator_totals)
     
-    with col4:
-        st.metric("HCV Testing", f"{hcv_testing_coverage:.1f}%")
+    anc_clients = totals.get('PMTCT_ANC_1 Number of New ANC clients', 0)
+    eid_samples = totals.get('PMTCT_EID_33. No. of of HEI whose samples were taken within 2 months of birth for DNA PCR', 0)
+    total_hiv_positive = sum(totals.get(col, 0) for col in INDICATOR_RATIOS['EID Coverage'][1])
+    kpis = dashboard.compute_ratios(totals, KPI_STRIP)
     
-    with col5:
-        st.metric("EID Coverage", f"{eid_coverage:.1f}%")
+    for col, name in zip(st.columns(len(KPI_STRIP)), KPI_STRIP):
+        with col:
+            st.metric(name, f"{kpis[name]:.1f}%")
     
     # VISUALIZATION SECTION 1: ANC HIV Testing
     st.markdown("---")
     st.markdown('<div class="section-header">NEW ANC VISIT VS HIV TESTING</div>', unsafe_allow_html=True)
     
-    fig_anc_testing, testing_rate = dashboard.create_anc_hiv_testing_chart()
+    fig_anc_testing, testing_rate = worker.result('anc_testing')
     st.plotly_chart(fig_anc_testing, use_container_width=True)
     
     # Feedback for ANC testing
@@ -820,7 +797,7 @@ def main():
     st.markdown("---")
     st.markdown('<div class="section-header">TESTED POSITIVE VERSUS STARTED ON TREATMENT ANC</div>', unsafe_allow_html=True)
     
-    fig_anc_treatment, total_art_percentage, art_early_percentage, art_late_percentage = dashboard.create_anc_treatment_cascade()
+    fig_anc_treatment, total_art_percentage, art_early_percentage, art_late_percentage = worker.result('anc_treatment')
     st.plotly_chart(fig_anc_treatment, use_container_width=True)
     
     # Feedback for ANC treatment
@@ -843,19 +820,19 @@ def main():
     
     with col1:
         st.markdown('<div class="section-header">LABOUR AND DELIVERY POSITIVE VERSUS TREATMENT</div>', unsafe_allow_html=True)
-        fig_ld_cascade, positivity_rate_ld, art_coverage_ld = dashboard.create_ld_cascade()
+        fig_ld_cascade, positivity_rate_ld, art_coverage_ld = worker.result('ld_cascade')
         st.plotly_chart(fig_ld_cascade, use_container_width=True)
     
     with col2:
         st.markdown('<div class="section-header">PREVIOUSLY KNOWN ON ART</div>', unsafe_allow_html=True)
-        fig_known, art_coverage_known = dashboard.create_previously_known_chart()
+        fig_known, art_coverage_known = worker.result('previously_known')
         st.plotly_chart(fig_known, use_container_width=True)
     
     # VISUALIZATION SECTION 4: Comprehensive ART Overview
     st.markdown("---")
     st.markdown('<div class="section-header">COMPREHENSIVE ART INITIATION OVERVIEW</div>', unsafe_allow_html=True)
     
-    fig_comprehensive_art = dashboard.create_comprehensive_art_chart()
+    fig_comprehensive_art = worker.result('comprehensive_art')
     st.plotly_chart(fig_comprehensive_art, use_container_width=True)
     
     # VISUALIZATION SECTION 5: Viral Hepatitis Testing
@@ -864,22 +841,12 @@ def main():
     
     with col1:
         st.markdown('<div class="section-header">VIRAL HEPATITIS TESTING B (HBV)</div>', unsafe_allow_html=True)
-        fig_hbv, hbv_percentage, hbv_tested, anc_clients = dashboard.create_comparison_chart(
-            "HBV Testing Coverage",
-            'PMTCT_HTS_10. Number of new ANC Clients tested for HBV ( ANC, L&D, <72hrs Post Partum)',
-            'PMTCT_ANC_1 Number of New ANC clients',
-            "HBV Tested", "ANC Clients"
-        )
+        fig_hbv, hbv_percentage, hbv_tested, anc_clients = worker.result('hbv')
         st.plotly_chart(fig_hbv, use_container_width=True)
     
     with col2:
         st.markdown('<div class="section-header">VIRAL HEPATITIS TESTING C (HCV)</div>', unsafe_allow_html=True)
-        fig_hcv, hcv_percentage, hcv_tested, anc_clients = dashboard.create_comparison_chart(
-            "HCV Testing Coverage",
-            'PMTCT_HTS_11. Number of new ANC Clients tested for HCV ( ANC, L&D, <72hrs Post Partum)',
-            'PMTCT_ANC_1 Number of New ANC clients',
-            "HCV Tested", "ANC Clients"
-        )
+        fig_hcv, hcv_percentage, hcv_tested, anc_clients = worker.result('hcv')
         st.plotly_chart(fig_hcv, use_container_width=True)
     
     # VISUALIZATION SECTION 6: Syphilis Testing and Treatment
@@ -888,22 +855,12 @@ def main():
     
     with col1:
         st.markdown('<div class="section-header">SYPHILLIS TESTING</div>', unsafe_allow_html=True)
-        fig_syphilis_test, syphilis_test_percentage, syphilis_tested, anc_clients = dashboard.create_comparison_chart(
-            "Syphilis Testing Coverage",
-            'PMTCT_ANC_2. Number of new ANC Clients tested for syphilis total',
-            'PMTCT_ANC_1 Number of New ANC clients',
-            "Syphilis Tested", "ANC Clients"
-        )
+        fig_syphilis_test, syphilis_test_percentage, syphilis_tested, anc_clients = worker.result('syphilis_test')
         st.plotly_chart(fig_syphilis_test, use_container_width=True)
     
     with col2:
         st.markdown('<div class="section-header">SYPHILLIS TREATMENT</div>', unsafe_allow_html=True)
-        fig_syphilis_treat, syphilis_treat_percentage, syphilis_treated, syphilis_positive = dashboard.create_comparison_chart(
-            "Syphilis Treatment Coverage",
-            'PMTCT_ANC_4. Number of the ANC Clients treated for Syphilis total',
-            'PMTCT_ANC_3. Number of new ANC Clients tested positive for syphilis Total',
-            "Treated", "Syphilis Positive"
-        )
+        fig_syphilis_treat, syphilis_treat_percentage, syphilis_treated, syphilis_positive = worker.result('syphilis_treat')
         st.plotly_chart(fig_syphilis_treat, use_container_width=True)
     
     # VISUALIZATION SECTION 7: Delivery Cascade and EID
@@ -912,17 +869,12 @@ def main():
     
     with col1:
         st.markdown('<div class="section-header">DELIVERY CASCADE</div>', unsafe_allow_html=True)
-        fig_delivery, delivery_percentage, hiv_deliveries, total_deliveries = dashboard.create_comparison_chart(
-            "Delivery Coverage for HIV+ Women",
-            'PMTCT_L&D_21. Number of booked HIV positive pregnant women who delivered at facility',
-            'PMTCT_L&D_20. Total deliveries at facility (booked and unbooked pregnant women)',
-            "HIV+ Deliveries", "Total Deliveries"
-        )
+        fig_delivery, delivery_percentage, hiv_deliveries, total_deliveries = worker.result('delivery')
         st.plotly_chart(fig_delivery, use_container_width=True)
     
     with col2:
         st.markdown('<div class="section-header">EID SAMPLE COLLECTION & RESULTS</div>', unsafe_allow_html=True)
-        fig_eid, eid_coverage, eid_positivity = dashboard.create_eid_chart()
+        fig_eid, eid_coverage, eid_positivity = worker.result('eid')
         st.plotly_chart(fig_eid, use_container_width=True)
     
     # VISUALIZATION SECTION 8: Hub & Spoke and Reporting Rates
@@ -931,33 +883,52 @@ def main():
     
     with col1:
         st.markdown('<div class="section-header">HUB & SPOKE REFERRAL SYSTEM</div>', unsafe_allow_html=True)
-        fig_referral, completion_rate = dashboard.create_hub_spoke_referral()
+        fig_referral, completion_rate = worker.result('referral')
         st.plotly_chart(fig_referral, use_container_width=True)
     
     with col2:
         st.markdown('<div class="section-header">REPORTING RATE TRENDS</div>', unsafe_allow_html=True)
-        fig_reporting = dashboard.create_reporting_trend()
+        fig_reporting = worker.result('reporting_trend')
         if fig_reporting:
             st.plotly_chart(fig_reporting, use_container_width=True)
             
             # Check reporting rates
-            comp_rate = dashboard.data['PMTCT MSF Comprehensive - Reporting rate'].mean()
-            spoke_rate = dashboard.data['PMTCT MSF FOR SPOKE SITES   - Reporting rate'].mean()
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if comp_rate >= 90:
-                    st.markdown(f'<div class="success-box">✅ Comprehensive Sites: {comp_rate:.1f}%</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="warning-box">❌ Comprehensive Sites: {comp_rate:.1f}%</div>', unsafe_allow_html=True)
-            
-            with col2:
-                if spoke_rate >= 90:
-                    st.markdown(f'<div class="success-box">✅ Spoke Sites: {spoke_rate:.1f}%</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="warning-box">❌ Spoke Sites: {spoke_rate:.1f}%</div>', unsafe_allow_html=True)
+            reporting_cols = [col for col in REPORTING_RATE_COLUMNS if col in dashboard.data.columns]
+            for col, reporting_col in zip(st.columns(len(reporting_cols)), reporting_cols):
+                label, _ = REPORTING_RATE_COLUMNS[reporting_col]
+                rate = dashboard.data[reporting_col].mean()
+                with col:
+                    if rate >= 90:
+                        st.markdown(f'<div class="success-box">✅ {label}: {rate:.1f}%</div>', unsafe_allow_html=True)
+                    else:
+                        st.markdown(f'<div class="warning-box">❌ {label}: {rate:.1f}%</div>', unsafe_allow_html=True)
         else:
-            st.info("No period data available for trend analysis")
+            st.info("No period or reporting rate data available for trend analysis")
+    
+    # VISUALIZATION SECTION 9: Period-lagged EID and ART cascade
+    st.markdown("---")
+    st.markdown('<div class="section-header">EID & ART CASCADE WITH PERIOD LAG</div>', unsafe_allow_html=True)
+    render_lagged_cascade(dashboard, worker.result('full_cube'), fingerprint, selection)
+    
+    # VISUALIZATION SECTION 10: Drill-down from national to facility
+    st.markdown("---")
+    st.markdown('<div class="section-header">DRILL-DOWN: NATIONAL → STATE → LGA → FACILITY</div>', unsafe_allow_html=True)
+    render_drilldown(dashboard, worker.result('aggregation_tree'))
+    
+    # VISUALIZATION SECTION 11: Facility-level coverage distribution
+    st.markdown("---")
+    st.markdown('<div class="section-header">FACILITY-LEVEL COVERAGE DISTRIBUTION</div>', unsafe_allow_html=True)
+    render_facility_distribution(dashboard, worker.result('aggregation_tree'))
+    
+    # VISUALIZATION SECTION 12: Coverage map
+    st.markdown("---")
+    st.markdown('<div class="section-header">COVERAGE MAP BY STATE AND LGA</div>', unsafe_allow_html=True)
+    render_choropleth(dashboard, worker.result('cube'), selection)
+    
+    # VISUALIZATION SECTION 13: Reporting completeness by facility and period
+    st.markdown("---")
+    st.markdown('<div class="section-header">REPORTING COMPLETENESS BY FACILITY</div>', unsafe_allow_html=True)
+    render_completeness(dashboard, worker.result('completeness'))
     
     # Data Summary and Export
     st.markdown("---")
@@ -978,7 +949,17 @@ def main():
         st.metric("EID Samples", eid_samples)
         st.metric("Filtered Records", len(filtered_df))
     
-    csv = filtered_df.to_csv(index=False)
+    league_table = worker.result('league_table')
+    if league_table is not None:
+        with st.expander("🏆 State League Table"):
+            st.dataframe(league_table, use_container_width=True)
+    
+    trend_matrix = worker.result('trend_matrix')
+    if trend_matrix is not None:
+        with st.expander("📈 Indicator Totals by Period"):
+            st.dataframe(trend_matrix, use_container_width=True)
+    
+    csv = worker.result('export_csv')
     st.download_button(
         label="📥 Download Filtered Data as CSV",
         data=csv,
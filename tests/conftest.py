@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_test import make_synthetic_dataset
+
+
+@pytest.fixture
+def synthetic_data():
+    """Small NDARS-shaped dataset: 40 facilities over 6 months"""
+    return make_synthetic_dataset(facilities=40, months=6, states=3, lgas=8)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pmtct_core import INDICATOR_COLUMNS, REPORTING_RATE_COLUMNS, AggregationTree, PMTCTDashboard, estimate_nbytes
+
+
+@pytest.fixture
+def dashboard(synthetic_data):
+    return PMTCTDashboard(synthetic_data)
+
+
+def test_trend_matrix_in_calendar_order(dashboard):
+    matrix = dashboard.build_trend_matrix(dashboard.build_aggregate_cube())
+    assert list(matrix.index) == ['January 2024', 'February 2024', 'March 2024',
+                                  'April 2024', 'May 2024', 'June 2024']
+
+
+def test_trend_matrix_sums_counts_and_averages_rates(dashboard):
+    matrix = dashboard.build_trend_matrix(dashboard.build_aggregate_cube())
+    grouped = dashboard.data.groupby('periodname')
+    counts = [col for col in INDICATOR_COLUMNS if col not in REPORTING_RATE_COLUMNS]
+    pd.testing.assert_frame_equal(matrix[counts], grouped[counts].sum().loc[matrix.index], check_dtype=False)
+    pd.testing.assert_frame_equal(matrix[list(REPORTING_RATE_COLUMNS)],
+                                  grouped[list(REPORTING_RATE_COLUMNS)].mean().loc[matrix.index])
+    assert matrix[list(REPORTING_RATE_COLUMNS)].le(100).all().all()
+    assert np.array_equal(matrix['record_count'], grouped.size().loc[matrix.index])
+
+
+def test_comparison_keeps_reporting_rates_out_of_the_counts(dashboard):
+    cube = dashboard.build_aggregate_cube()
+    ratios, counts, records = dashboard.compare_selections(
+        cube, {'periodname': ['January 2024']}, {'periodname': ['February 2024']})
+    
+    assert not set(REPORTING_RATE_COLUMNS) & set(counts.index)
+    assert 'record_count' not in counts.index
+    assert records == {'A': 40, 'B': 40}
+    
+    data = dashboard.data
+    for col, (label, _) in REPORTING_RATE_COLUMNS.items():
+        expected = [data.loc[data['periodname'] == period, col].mean() for period in ['January 2024', 'February 2024']]
+        np.testing.assert_allclose(ratios.loc[f"{label} Reporting Rate", ['A (%)', 'B (%)']], np.round(expected, 1))
+
+
+@pytest.mark.parametrize('dropped', [[], ['orgunitlevel2']])
+def test_aggregation_tree_matches_groupby(synthetic_data, dropped):
+    data = synthetic_data.drop(columns=dropped)
+    dashboard = PMTCTDashboard(data)
+    tree = AggregationTree(dashboard.build_aggregate_cube())
+    levels = [col for col in ['orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3'] if col not in dropped]
+    assert tree.levels == levels
+    
+    indicators = [col for col in INDICATOR_COLUMNS if col in dashboard.data.columns]
+    reference = dashboard.data.assign(record_count=1)
+    sizes = estimate_nbytes(tree)
+    for depth in range(len(levels) + 1):
+        expected = (reference.groupby(levels[:depth])[indicators + ['record_count']].sum() if depth
+                    else reference[indicators + ['record_count']].sum().to_frame().T)
+        for key in expected.index:
+            path = (key if isinstance(key, tuple) else (key,)) if depth else ()
+            assert tree.has_node(list(path))
+            pd.testing.assert_series_equal(tree.totals(list(path))[expected.columns], expected.loc[key],
+                                           check_names=False, check_dtype=False)
+            
+            children = tree.children(path)
+            if depth == len(levels):
+                assert children is None
+                continue
+            below = reference.groupby(levels[:depth + 1])[indicators + ['record_count']].sum()
+            if depth:
+                below = below.xs(path, level=list(range(depth)))
+            pd.testing.assert_frame_equal(children[below.columns], below, check_dtype=False)
+    
+    assert not tree.has_node(['Nowhere'])
+    assert not tree.has_node(['State 0'] * (len(levels) + 1))
+    # Drilling reads what was built up front, so the size the result cache charged stays right
+    assert estimate_nbytes(tree) == sizes
@@ -0,0 +1,128 @@
+import http.client
+import json
+import os
+import threading
+
+import pytest
+from http.server import ThreadingHTTPServer
+
+from pmtct_api import DatasetSource, KPIRequestHandler
+from pmtct_core import REPORTING_RATE_COLUMNS
+
+
+@pytest.fixture
+def dataset_path(tmp_path, synthetic_data):
+    path = tmp_path / 'pmtct.csv'
+    synthetic_data.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start the API on a free port for a dataset path and return a request function"""
+    servers = []
+    
+    def start(path):
+        handler = type('Handler', (KPIRequestHandler,), {'source': DatasetSource(str(path)),
+                                                          'log_message': lambda *args: None})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        
+        def request(url, etag=None):
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=30)
+            connection.request('GET', url, headers={'If-None-Match': etag} if etag else {})
+            response = connection.getresponse()
+            body = response.read()
+            connection.close()
+            return response.status, response.getheader('ETag'), json.loads(body) if body else None
+        return request
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_kpis_etag_then_304(serve, dataset_path):
+    request = serve(dataset_path)
+    status, etag, body = request('/api/kpis?state=State%200')
+    assert status == 200
+    assert body['filters'] == {'state': ['State 0']}
+    assert body['records'] > 0
+    assert not set(REPORTING_RATE_COLUMNS) & set(body['totals'])
+    assert all(0 <= rate <= 100 for rate in body['reporting_rates'].values())
+    assert 'ANC HIV Testing' in body['ratios']
+    
+    status, again, body = request('/api/kpis?state=State%200', etag)
+    assert (status, again, body) == (304, etag, None)
+    
+    # A different filter is a different resource
+    status, other, _ = request('/api/kpis?state=State%201', etag)
+    assert status == 200 and other != etag
+
+
+def test_filters_etag_then_304(serve, dataset_path):
+    request = serve(dataset_path)
+    status, etag, body = request('/api/filters')
+    assert status == 200
+    assert body['filters']['state'] == ['State 0', 'State 1', 'State 2']
+    assert len(body['filters']['period']) == 6
+    assert request('/api/filters', etag)[0] == 304
+
+
+def test_unknown_filter_is_rejected(serve, dataset_path):
+    status, _, body = serve(dataset_path)('/api/kpis?district=x')
+    assert status == 400
+    assert 'district' in body['error']
+
+
+def test_reload_after_mtime_change(serve, dataset_path, synthetic_data):
+    request = serve(dataset_path)
+    _, etag, before = request('/api/kpis')
+    
+    synthetic_data[synthetic_data['orgunitlevel1'] == 'State 0'].to_csv(dataset_path, index=False)
+    stat = os.stat(dataset_path)
+    os.utime(dataset_path, (stat.st_atime, stat.st_mtime + 10))
+    
+    status, new_etag, after = request('/api/kpis', etag)
+    assert status == 200
+    assert new_etag != etag
+    assert after['dataset'] != before['dataset']
+    assert after['records'] < before['records']
+    _, _, filters = request('/api/filters')
+    assert filters['filters']['state'] == ['State 0']
+
+
+def test_missing_file_before_first_load(serve, tmp_path):
+    for url in ['/api/kpis', '/api/filters']:
+        status, _, body = serve(tmp_path / 'missing.csv')(url)
+        assert status == 503
+        assert 'not available' in body['error']
+
+
+def test_deleted_file_keeps_last_snapshot(serve, dataset_path):
+    request = serve(dataset_path)
+    _, etag, before = request('/api/kpis')
+    os.remove(dataset_path)
+    
+    status, same, after = request('/api/kpis')
+    assert status == 200
+    assert (same, after) == (etag, before)
+    assert request('/api/kpis', etag)[0] == 304
+    assert request('/api/filters')[0] == 200
+
+
+def test_half_written_file_keeps_last_snapshot(serve, dataset_path):
+    request = serve(dataset_path)
+    _, etag, before = request('/api/kpis')
+    
+    # A copy in progress: empty, then with a half-written last row that does not parse
+    complete = dataset_path.read_bytes()
+    for content in [b'', complete[:len(complete) // 2] + b',' * 40]:
+        dataset_path.write_bytes(content)
+        stat = os.stat(dataset_path)
+        os.utime(dataset_path, (stat.st_atime, stat.st_mtime + 10))
+        status, same, after = request('/api/kpis')
+        assert status == 200
+        assert (same, after) == (etag, before)
@@ -0,0 +1,139 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from pmtct_core import (
+    BOUNDARY_NAME_PROPERTIES, BOUNDARY_PARENT_PROPERTIES, BOUNDARY_PRECISION, MAP_ZOOM_TOLERANCES, BoundaryLayer
+)
+
+
+def wiggly_line(start, end, rng, points=150, amplitude=0.006):
+    """Polyline from start to end with jitter across it around both zoom tolerances"""
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    steps = np.linspace(0, 1, points)[:, None]
+    normal = np.array([start[1] - end[1], end[0] - start[0]]) / np.hypot(*(end - start))
+    offsets = rng.normal(0, amplitude, points) * np.sin(np.pi * steps[:, 0])
+    return start + steps * (end - start) + offsets[:, None] * normal
+
+
+@pytest.fixture
+def layer():
+    """Four states on a 2x2 grid with jagged shared borders, the south-west one
+    with a hole filled by a fifth enclave state"""
+    rng = np.random.default_rng(0)
+    lines = {}
+
+    def border(a, b):
+        # Each border is drawn once and reused, reversed, by the area on its other side
+        if (b, a) in lines:
+            return lines[(b, a)][::-1]
+        lines[(a, b)] = wiggly_line(a, b, rng)
+        return lines[(a, b)]
+
+    features = []
+    for col, row in itertools.product(range(2), range(2)):
+        x, y = 2 * col, 2 * row
+        corners = [(x, y), (x + 2, y), (x + 2, y + 2), (x, y + 2), (x, y)]
+        ring = np.concatenate([border(a, b)[:-1] for a, b in zip(corners[:-1], corners[1:])])
+        features.append((f"State {col}{row}", [np.vstack([ring, ring[:1]])]))
+
+    angles = np.linspace(0, 2 * np.pi, 120, endpoint=False)
+    radius = 0.3 + rng.normal(0, 0.005, len(angles))
+    enclave = np.column_stack([1 + radius * np.cos(angles), 1 + radius * np.sin(angles)])
+    enclave = np.vstack([enclave, enclave[:1]])
+    features[0][1].append(enclave[::-1])
+    features.append(("Enclave", [enclave]))
+
+    collection = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': name},
+         'geometry': {'type': 'Polygon', 'coordinates': [np.round(ring, BOUNDARY_PRECISION).tolist() for ring in rings]}}
+        for name, rings in features
+    ]}
+    return collection, BoundaryLayer(collection, ['name'])
+
+
+def grid_points(ring):
+    """Ring vertices as integer grid keys, so float formatting cannot hide a mismatch"""
+    return [tuple(np.round(np.asarray(point) * 10 ** BOUNDARY_PRECISION).astype(np.int64)) for point in ring]
+
+
+def feature_rings(feature):
+    if feature['geometry']['type'] == 'Polygon':
+        return feature['geometry']['coordinates']
+    return [ring for polygon in feature['geometry']['coordinates'] for ring in polygon]
+
+
+def shared_edges(rings, shared):
+    """Edges, in either direction, whose both ends lie on a border shared with another area"""
+    edges = set()
+    for ring in rings:
+        points = grid_points(ring)
+        edges |= {frozenset(edge) for edge in zip(points[:-1], points[1:]) if edge[0] in shared and edge[1] in shared}
+    return edges
+
+
+@pytest.mark.parametrize('zoom', list(MAP_ZOOM_TOLERANCES))
+def test_shared_borders_simplify_identically(layer, zoom):
+    collection, boundaries = layer
+    original = {feature['properties']['name']: feature_rings(feature) for feature in collection['features']}
+    simplified = {feature['properties']['name']: feature_rings(feature)
+                  for feature in boundaries.geojson(zoom)['features']}
+    assert set(simplified) == set(original)
+
+    vertices = {name: {point for ring in rings for point in grid_points(ring)} for name, rings in original.items()}
+    for name, rings in simplified.items():
+        for ring in rings:
+            assert len(ring) >= 4 and ring[0] == ring[-1]
+        # Simplification only drops vertices, it never moves one off the original outline
+        assert {point for ring in rings for point in grid_points(ring)} <= vertices[name]
+        assert sum(map(len, rings)) < sum(map(len, original[name]))
+
+    neighbours = 0
+    for first, second in itertools.combinations(original, 2):
+        shared = vertices[first] & vertices[second]
+        if len(shared) < 2:
+            continue
+        neighbours += 1
+        first_edges = shared_edges(simplified[first], shared)
+        assert first_edges, (first, second)
+        assert first_edges == shared_edges(simplified[second], shared), (first, second)
+    # Four grid borders, plus the enclave inside the south-west state
+    assert neighbours == 5
+
+
+def test_coarser_zoom_keeps_fewer_points(layer):
+    _, boundaries = layer
+    counts = {
+        zoom: sum(len(ring) for feature in boundaries.geojson(zoom)['features'] for ring in feature_rings(feature))
+        for zoom in MAP_ZOOM_TOLERANCES
+    }
+    assert counts['national'] < counts['state']
+
+
+def test_lga_names_match_one_to_one_and_keep_their_direction():
+    lgas = [('Kwara', 'Ilorin West'), ('Kwara', 'Ilorin South'), ('Kwara', 'Oke Ero'), ('Kwara', 'Ekiti'),
+            ('Oyo', 'Oyo West'), ('Oyo', 'Ibadan North West'), ('Oyo', 'Ibadan North East'), ('Oyo', 'Ogbomosho North')]
+    collection = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'lganame': lga, 'statename': state},
+         'geometry': {'type': 'Polygon', 'coordinates': [[[i, 0], [i + 1, 0], [i + 1, 1], [i, 1], [i, 0]]]}}
+        for i, (state, lga) in enumerate(lgas)
+    ]}
+    layer = BoundaryLayer(collection, BOUNDARY_NAME_PROPERTIES['orgunitlevel2'], BOUNDARY_PARENT_PROPERTIES)
+    feature = {lga: str(i) for i, (_, lga) in enumerate(lgas)}
+    
+    expected = [
+        (('kw Ilorin East LGA', 'kw Kwara State'), None),
+        (('kw Ilorin West LGA', 'kw Kwara State'), feature['Ilorin West']),
+        (('Oke-Ero', 'Kwara'), feature['Oke Ero']),
+        # A misspelling listed first does not take a feature another name matches exactly
+        (('Ekitii', 'Kwara'), None),
+        (('Ekiti', 'Kwara'), feature['Ekiti']),
+        (('Oyo East', 'Oyo'), None),
+        (('Ibadan North-East', 'Oyo'), feature['Ibadan North East']),
+        (('Ibadan South East', 'Oyo'), None),
+        # Of two misspellings of one area, the closer gets it
+        (('Ogbomo North', 'Oyo'), None),
+        (('Ogbomossho North', 'Oyo'), feature['Ogbomosho North']),
+    ]
+    assert layer.match_areas([area for area, _ in expected]) == [feature_id for _, feature_id in expected]
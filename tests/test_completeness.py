@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from load_test import make_synthetic_dataset
+from pmtct_core import REPORTING_RATE_COLUMNS, PMTCTDashboard, ReportingCompleteness, _popcount, _shift_up
+
+LEVELS = ['orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3']
+
+
+@pytest.fixture
+def data():
+    """30 facilities over 80 months, so the bitsets span two words, with long
+    gaps planted on both sides of the 64-period word boundary"""
+    data = make_synthetic_dataset(facilities=30, months=80, states=2, lgas=5)
+    rates = list(REPORTING_RATE_COLUMNS)
+    periods = data['periodname'].unique()
+
+    def miss(facility, first, last):
+        rows = (data['orgunitlevel3'] == f"Facility {facility}") & data['periodname'].isin(periods[first:last])
+        data.loc[rows, rates] = 0
+
+    miss(0, 58, 70)    # crosses the boundary
+    miss(1, 0, 80)     # never reported
+    miss(2, 60, 80)    # missing up to the latest period
+    miss(3, 64, 65)    # only the first period of the second word
+    miss(4, 63, 64)    # only the last period of the first word
+    return data
+
+
+def reference(data):
+    """Reported or not per facility and period, as a plain boolean DataFrame in calendar order"""
+    reported = data[list(REPORTING_RATE_COLUMNS)].gt(0).any(axis=1)
+    table = data.assign(reported=reported).pivot_table(
+        index=LEVELS, columns='periodname', values='reported', aggfunc='any', fill_value=False
+    ).astype(bool)
+    order = sorted(table.columns, key=lambda name: pd.to_datetime(name, format='%B %Y'))
+    return table[order]
+
+
+def missing_runs(row):
+    """Longest and trailing run of False in a sequence of booleans"""
+    longest = current = 0
+    for value in row:
+        current = 0 if value else current + 1
+        longest = max(longest, current)
+    return longest, current
+
+
+@pytest.fixture
+def completeness(data):
+    return ReportingCompleteness(PMTCTDashboard(data).build_aggregate_cube())
+
+
+def test_popcount_matches_bin_count():
+    words = np.random.default_rng(0).integers(0, 2 ** 63, (50, 3), dtype=np.int64).astype(np.uint64)
+    words[0] = np.uint64(0xFFFFFFFFFFFFFFFF)
+    words[1] = 0
+    expected = [sum(bin(int(word)).count('1') for word in row) for row in words]
+    assert _popcount(words).tolist() == expected
+
+
+def test_shift_up_carries_across_words():
+    words = np.random.default_rng(1).integers(0, 2 ** 63, (20, 3), dtype=np.int64).astype(np.uint64) << np.uint64(1)
+    mask = (1 << 192) - 1
+    for row, shifted in zip(words, _shift_up(words)):
+        value = sum(int(word) << (64 * i) for i, word in enumerate(row))
+        assert sum(int(word) << (64 * i) for i, word in enumerate(shifted)) == (value << 1) & mask
+
+
+def test_matrix_and_counts_match_reference(data, completeness):
+    ref = reference(data)
+    assert completeness.periods == list(ref.columns)
+    assert list(completeness.facilities) == list(ref.index)
+    np.testing.assert_array_equal(completeness.matrix(), ref.to_numpy())
+    np.testing.assert_array_equal(completeness.reported_counts(), ref.sum(axis=1).to_numpy())
+
+
+def test_missing_streaks_match_reference(data, completeness):
+    ref = reference(data)
+    runs = [missing_runs(row) for row in ref.to_numpy()]
+    table = completeness.facility_table()
+    assert table['Longest Missing Streak'].tolist() == [longest for longest, _ in runs]
+    assert table['Current Missing Streak'].tolist() == [current for _, current in runs]
+
+    streaks = table['Longest Missing Streak']
+    assert streaks[('State 0', 'LGA 0', 'Facility 0')] >= 12
+    assert streaks[('State 1', 'LGA 1', 'Facility 1')] == 80
+    assert table.loc[('State 0', 'LGA 2', 'Facility 2'), 'Current Missing Streak'] >= 20
+
+
+def test_period_rates_match_reference(data, completeness):
+    ref = reference(data)
+    pd.testing.assert_series_equal(completeness.period_rates(), ref.mean(axis=0) * 100,
+                                   check_names=False, check_index_type=False)
+
+
+@pytest.mark.parametrize('level', ['orgunitlevel1', 'orgunitlevel2'])
+def test_unit_rates_match_reference(data, completeness, level):
+    ref = reference(data)
+    keys = LEVELS[:LEVELS.index(level) + 1]
+    grouped = ref.groupby(level=keys)
+    expected = pd.DataFrame({
+        'Facilities': grouped.size(),
+        'Reports Received': grouped.sum().sum(axis=1),
+        'Missing Latest Period': (~ref.iloc[:, -1]).groupby(level=keys).sum(),
+    })
+    expected['Completeness (%)'] = expected['Reports Received'] / (expected['Facilities'] * ref.shape[1]) * 100
+
+    rates = completeness.unit_rates(level)
+    assert rates['Reports Expected'].tolist() == (rates['Facilities'] * ref.shape[1]).tolist()
+    for col in expected.columns:
+        np.testing.assert_allclose(rates[col].sort_index().to_numpy(dtype=float),
+                                   expected[col].sort_index().to_numpy(dtype=float), err_msg=col)
+
+
+def test_rows_without_a_period_set_no_bit(data):
+    ref = reference(data)
+    stray = data[data['periodname'] == data['periodname'].iloc[0]].assign(periodname=None)
+    stray[list(REPORTING_RATE_COLUMNS)] = 100
+    cube = PMTCTDashboard(pd.concat([data, stray], ignore_index=True)).build_aggregate_cube()
+    assert cube['periodname'].isna().any()
+
+    completeness = ReportingCompleteness(cube)
+    assert completeness.periods == list(ref.columns)
+    np.testing.assert_array_equal(completeness.matrix(), ref.to_numpy())
@@ -0,0 +1,126 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from pmtct_core import JSONStreamReader, read_json_checked
+
+ANC_1 = 'PMTCT_ANC_1 Number of New ANC clients'
+ANC_2 = 'PMTCT_ANC_2. Number of new ANC Clients tested for syphilis total'
+
+
+class CountingFile(io.BytesIO):
+    """Binary file that remembers how far it has been read"""
+    furthest = 0
+    
+    def read(self, *args):
+        chunk = super().read(*args)
+        self.furthest = max(self.furthest, self.tell())
+        return chunk
+    
+    def read1(self, *args):
+        chunk = super().read1(*args)
+        self.furthest = max(self.furthest, self.tell())
+        return chunk
+
+
+def analytics_export(rows, hierarchy, items=None):
+    return json.dumps({
+        'headers': [{'name': name} for name in ['dx', 'pe', 'ou', 'value']],
+        'metaData': {
+            'items': items or {'de1': {'name': ANC_1}, 'de2': {'name': ANC_2}},
+            'dimensions': {'dx': list(items or {'de1': None, 'de2': None})},
+            'ouNameHierarchy': hierarchy,
+        },
+        'rows': rows,
+    }).encode('utf-8')
+
+
+def test_org_unit_paths_are_aligned_from_the_top():
+    hierarchy = {
+        'kano': '/Nigeria/Kano',
+        'dala': '/Nigeria/Kano/Dala',
+        'clinic': '/Nigeria/Kano/Dala/Dala Clinic',
+        'gwale': '/Nigeria/Kano/Gwale',
+    }
+    rows = [['de1', '202401', 'clinic', '5'], ['de2', '202401', 'clinic', '3'], ['de1', '202401', 'gwale', '2']]
+    data, report = read_json_checked(io.BytesIO(analytics_export(rows, hierarchy)))
+    
+    levels = data.set_index('organisationunitname')[['orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3']]
+    expected = pd.DataFrame([['Kano', 'Dala', 'Dala Clinic'], ['Kano', 'Gwale', None]],
+                            index=['Dala Clinic', 'Gwale'], columns=levels.columns)
+    pd.testing.assert_frame_equal(levels.loc[expected.index], expected, check_names=False, check_dtype=False)
+    clinic = data.set_index('organisationunitname').loc['Dala Clinic']
+    assert (clinic[ANC_1], clinic[ANC_2]) == (5, 3)
+    assert data['periodname'].unique().tolist() == ['January 2024']
+    assert not report.notes
+
+
+def test_ward_paths_keep_facilities_apart():
+    hierarchy = {
+        'a': '/Nigeria/Kano/Dala/Ward A/Clinic X',
+        'b': '/Nigeria/Kano/Dala/Ward A/Clinic Y',
+    }
+    rows = [['de1', '202401', 'a', '5'], ['de1', '202401', 'b', '7']]
+    data, _ = read_json_checked(io.BytesIO(analytics_export(rows, hierarchy)))
+    
+    assert data[['orgunitlevel1', 'orgunitlevel2', 'orgunitlevel3', ANC_1]].values.tolist() == [
+        ['Kano', 'Dala', 'Clinic X', 5], ['Kano', 'Dala', 'Clinic Y', 7]]
+
+
+def test_state_and_lga_totals_are_not_counted_twice():
+    hierarchy = {
+        'kano': '/Nigeria/Kano',
+        'dala': '/Nigeria/Kano/Dala',
+        'x': '/Nigeria/Kano/Dala/Ward A/Clinic X',
+        'y': '/Nigeria/Kano/Dala/Ward B/Clinic Y',
+    }
+    # The state and LGA rows total the two clinics
+    rows = [['de1', '202401', ou, value] for ou, value in [('kano', '12'), ('dala', '12'), ('x', '5'), ('y', '7')]]
+    data, report = read_json_checked(io.BytesIO(analytics_export(rows, hierarchy)))
+    
+    assert sorted(data['orgunitlevel3']) == ['Clinic X', 'Clinic Y']
+    assert data[ANC_1].sum() == 12
+    assert any('2 org unit(s) above facility level' in note for note in report.notes)
+    assert not report.complete
+
+
+def test_data_value_sets_without_hierarchy_are_reported():
+    export = json.dumps({'dataValues': [
+        {'dataElement': ANC_1, 'period': '202402', 'orgUnit': 'Dala Clinic', 'value': '4'},
+        {'dataElement': ANC_1, 'period': '202402', 'orgUnit': 'Dala Clinic',
+         'categoryOptionCombo': 'default', 'value': '2'},
+    ]}).encode('utf-8')
+    data, report = read_json_checked(io.BytesIO(export))
+    
+    assert data[['orgunitlevel3', ANC_1]].values.tolist() == [['Dala Clinic', 6]]
+    assert {'orgunitlevel1', 'orgunitlevel2'} <= set(report.missing_dimensions)
+    assert not report.complete
+    assert any('no org unit hierarchy' in message for message in report.messages())
+
+
+def test_wrong_analytics_export_fails_before_its_rows_are_read():
+    items = {'x1': {'name': 'Malaria cases'}, 'x2': {'name': 'Malaria tests'}}
+    rows = [['x1', '202401', f'ou{i}', str(i)] for i in range(50000)]
+    f = CountingFile(analytics_export(rows, {}, items))
+    
+    with pytest.raises(ValueError, match="None of the PMTCT indicator columns"):
+        read_json_checked(f)
+    assert f.furthest < len(f.getvalue()) / 10
+
+
+@pytest.mark.parametrize('export, message', [
+    ({'headers': [{'name': 'dx'}, {'name': 'pe'}], 'rows': [['a', 'b']]}, "headers are missing: ou, value"),
+    ({'dataValues': [{'dataElement': ANC_1, 'value': '1'}]}, "values are missing: period, orgUnit"),
+    ({'dataSet': 'x'}, "Not a DHIS2 analytics or dataValueSets JSON export"),
+])
+def test_malformed_exports_are_rejected(export, message):
+    with pytest.raises(ValueError, match=message):
+        read_json_checked(io.BytesIO(json.dumps(export).encode('utf-8')))
+
+
+def test_numbers_split_across_chunks_are_read_whole():
+    document = json.dumps({'rows': [123456789, 1.5e10, -42, 'text', True]})
+    reader = JSONStreamReader(io.StringIO(document), chunk_size=3)
+    assert [value for _, value, _ in reader.members({'rows'})] == [123456789, 1.5e10, -42, 'text', True]
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pmtct_core import HISTOGRAM_BIN_WIDTH, bin_scatter_points, coverage_box_stats, coverage_histogram
+
+
+@pytest.fixture
+def coverage():
+    """Facility coverage indexed by (state, facility): mostly near target, with a
+    long tail of over-reporting facilities and a few far above 200%"""
+    rng = np.random.default_rng(0)
+    facilities = 20000
+    values = np.clip(rng.normal(85, 15, facilities), 0, None)
+    values[rng.choice(facilities, 400, replace=False)] = rng.uniform(100, 180, 400)
+    values[:25] = rng.uniform(250, 1000, 25)
+    index = pd.MultiIndex.from_arrays([[f"State {i % 7}" for i in range(facilities)],
+                                       [f"Facility {i}" for i in range(facilities)]])
+    return pd.DataFrame({'volume': rng.lognormal(3, 1.2, facilities).round() + 1, 'coverage': values}, index=index)
+
+
+@pytest.mark.parametrize('max_points', [50, 500, 5000])
+def test_scatter_cap_holds_and_counts_every_facility(coverage, max_points):
+    points = bin_scatter_points(coverage, max_points=max_points)
+    assert len(points) <= max_points
+    assert points['facilities'].sum() == len(coverage)
+    
+    # Each point is one of the facilities it stands for, not a blend of them
+    original = coverage.reset_index(drop=True)
+    names = [' / '.join(name) for name in coverage.index]
+    rows = pd.Series(range(len(names)), index=names).loc[points['name']].to_numpy()
+    np.testing.assert_array_equal(points['volume'], original['volume'].to_numpy()[rows])
+    np.testing.assert_array_equal(points['coverage'], original['coverage'].to_numpy()[rows])
+
+
+def test_scatter_under_the_cap_is_unchanged(coverage):
+    small = coverage.iloc[:100]
+    points = bin_scatter_points(small, max_points=100)
+    assert len(points) == 100
+    assert (points['facilities'] == 1).all()
+
+
+def test_histogram_bins_and_overflow(coverage):
+    counts, edges = coverage_histogram(coverage)
+    values = coverage['coverage'].to_numpy()
+    assert counts.sum() == len(values)
+    assert np.isinf(edges[-1])
+    
+    # The last regular edge is the 99th percentile rounded up to a bin, kept within 100-200
+    upper = edges[-2]
+    assert upper % HISTOGRAM_BIN_WIDTH == 0 and 100 <= upper <= 200
+    assert upper == min(max(100, np.ceil(np.percentile(values, 99) / HISTOGRAM_BIN_WIDTH) * HISTOGRAM_BIN_WIDTH), 200)
+    assert counts[-1] == (values >= upper).sum()
+    assert counts[-1] >= 25
+    for count, low, high in zip(counts[:-1], edges[:-2], edges[1:-1]):
+        assert count == ((values >= low) & (values < high)).sum()
+
+
+def test_histogram_of_low_coverage_still_reaches_100():
+    counts, edges = coverage_histogram(pd.DataFrame({'coverage': [10.0, 20.0, 30.0]}))
+    assert edges[-2] == 100
+    assert counts.sum() == 3 and counts[-1] == 0
+
+
+def test_box_stats_match_pandas(coverage):
+    stats = coverage_box_stats(coverage)
+    values = coverage['coverage']
+    for state, group in values.groupby(level=0):
+        q1, median, q3 = group.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        expected = {
+            'q1': q1, 'median': median, 'q3': q3,
+            'lowerfence': group[group >= q1 - 1.5 * iqr].min(),
+            'upperfence': group[group <= q3 + 1.5 * iqr].max(),
+            'facilities': len(group),
+        }
+        for name, value in expected.items():
+            assert stats.loc[state, name] == pytest.approx(value), (state, name)
+        # Whiskers end on real facilities inside the box's reach
+        assert stats.loc[state, 'upperfence'] in set(group)
+        assert stats.loc[state, 'upperfence'] < group.max()
@@ -0,0 +1,44 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pmtct_core import PMTCTDashboard, load_extract_bundle, directory_extract_sources, resolve_extract_directory
+
+
+def test_bundle_stacks_extracts_in_first_extract_column_order(tmp_path, synthetic_data):
+    states = sorted(synthetic_data['orgunitlevel1'].unique())
+    for i, state in enumerate(states):
+        extract = synthetic_data[synthetic_data['orgunitlevel1'] == state]
+        # Later extracts list their columns in reverse
+        columns = list(extract.columns) if i == 0 else list(reversed(extract.columns))
+        extract[columns].to_csv(tmp_path / f'{state}.csv', index=False)
+    
+    data, report = load_extract_bundle(directory_extract_sources(tmp_path), max_workers=2)
+    
+    expected = PMTCTDashboard(synthetic_data).data
+    expected = pd.concat([expected[expected['orgunitlevel1'] == state] for state in states], ignore_index=True)
+    assert list(data.columns) == list(synthetic_data.columns)
+    pd.testing.assert_frame_equal(data, expected, check_dtype=False)
+
+
+def test_bundle_rejects_mismatched_columns(tmp_path, synthetic_data):
+    synthetic_data.to_csv(tmp_path / 'a.csv', index=False)
+    synthetic_data.drop(columns=['organisationunitname']).to_csv(tmp_path / 'b.csv', index=False)
+    with pytest.raises(ValueError, match="b.csv: missing \\['organisationunitname'\\]"):
+        load_extract_bundle(directory_extract_sources(tmp_path))
+
+
+def test_extract_folders_stay_inside_the_root(tmp_path):
+    root = tmp_path / 'extracts'
+    (root / 'march').mkdir(parents=True)
+    (tmp_path / 'private').mkdir()
+    os.symlink(tmp_path / 'private', root / 'link')
+    
+    assert resolve_extract_directory('march', str(root)) == os.path.realpath(root / 'march')
+    assert resolve_extract_directory(str(root / 'march'), str(root)) == os.path.realpath(root / 'march')
+    for path in ['..', '../private', str(tmp_path / 'private'), '/', 'link']:
+        with pytest.raises(ValueError, match="outside"):
+            resolve_extract_directory(path, str(root))
+    with pytest.raises(ValueError, match="not found"):
+        resolve_extract_directory('april', str(root))
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from load_test import make_synthetic_dataset
+from pmtct_core import LAGGED_RATIOS, LaggedCascade, PMTCTDashboard
+
+
+@pytest.fixture
+def cube():
+    """Aggregate cube over 8 months with April missing entirely, a fifth of the
+    facility-months dropped and quarterly rows that are not calendar months"""
+    data = make_synthetic_dataset(facilities=40, months=8, states=3, lgas=8)
+    rng = np.random.default_rng(1)
+    data = data[(data['periodname'] != 'April 2024') & (rng.random(len(data)) > 0.2)]
+    quarterly = data[data['periodname'] == 'January 2024'].assign(periodname='Q1 2024')
+    data = pd.concat([data, quarterly], ignore_index=True)
+    return PMTCTDashboard(data).build_aggregate_cube()
+
+
+def monthly_totals(cube, name, level):
+    """Numerator and denominator per org unit and calendar month, by plain groupby"""
+    numerator_cols, denominator_cols = LAGGED_RATIOS[name]
+    frame = cube.assign(
+        month=pd.to_datetime(cube['periodname'], format='%B %Y', errors='coerce').dt.to_period('M'),
+        unit=cube[level] if level else 'National',
+        num=cube[[col for col in numerator_cols if col in cube.columns]].sum(axis=1),
+        den=cube[[col for col in denominator_cols if col in cube.columns]].sum(axis=1),
+    ).dropna(subset=['month'])
+    return frame.groupby(['unit', 'month'])[['num', 'den']].sum().reset_index()
+
+
+def naive_lagged(cube, name, lag, window, level):
+    """Every unit and month from the first to the last month, with the denominator
+    averaged over `window` months ending `lag` months earlier, merged on shifted periods"""
+    totals = monthly_totals(cube, name, level)
+    months = pd.period_range(totals['month'].min(), totals['month'].max(), freq='M')
+    grid = pd.MultiIndex.from_product([sorted(totals['unit'].unique()), months],
+                                      names=['unit', 'month']).to_frame(index=False)
+    grid = grid.merge(totals[['unit', 'month', 'num']], on=['unit', 'month'], how='left')
+    grid['num'] = grid['num'].fillna(0)
+    
+    lagged = np.zeros(len(grid))
+    for back in range(lag, lag + window):
+        shifted = totals[['unit', 'month', 'den']].assign(month=totals['month'] + back)
+        lagged += grid[['unit', 'month']].merge(shifted, on=['unit', 'month'], how='left')['den'].fillna(0).to_numpy()
+    grid['den'] = lagged / window
+    # Windows reaching back before the first month of data have no denominator
+    grid.loc[(grid['month'] - (lag + window - 1)) < months[0], 'den'] = np.nan
+    return grid, months
+
+
+def ratio(num, den):
+    return num / den.where(den > 0) * 100
+
+
+LAGS = [(0, 1), (1, 1), (2, 1), (1, 2), (0, 3), (3, 2)]
+
+
+@pytest.mark.parametrize('lag, window', LAGS)
+@pytest.mark.parametrize('level', ['orgunitlevel1', 'orgunitlevel2', None])
+def test_ratios_match_merge_on_shifted_periods(cube, lag, window, level):
+    cascade = LaggedCascade(cube, level)
+    for name in LAGGED_RATIOS:
+        grid, months = naive_lagged(cube, name, lag, window, level)
+        expected = ratio(grid['num'], grid['den']).to_numpy().reshape(-1, len(months))
+        
+        result = cascade.ratios(name, lag, window)
+        assert list(result.columns) == list(months)
+        assert list(result.index) == sorted(grid['unit'].unique())
+        np.testing.assert_allclose(result.to_numpy(), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('lag, window', LAGS)
+def test_national_and_unit_summary_match_reference(cube, lag, window):
+    cascade = LaggedCascade(cube, 'orgunitlevel1')
+    selected = pd.PeriodIndex(['2024-03', '2024-05', '2024-08'], freq='M')
+    for name in LAGGED_RATIOS:
+        grid, months = naive_lagged(cube, name, lag, window, 'orgunitlevel1')
+        
+        by_month = grid.groupby('month')[['num', 'den']].sum(min_count=1)
+        np.testing.assert_allclose(cascade.national(name, lag, window).to_numpy(),
+                                   ratio(by_month['num'], by_month['den']).to_numpy(), equal_nan=True)
+        national = cascade.national(name, lag, window, selected)
+        assert list(national.index) == list(selected)
+        np.testing.assert_allclose(national.to_numpy(),
+                                   ratio(by_month['num'], by_month['den']).loc[selected].to_numpy(), equal_nan=True)
+        
+        # Unit totals only count months whose lagged denominator exists
+        usable = grid[grid['den'].notna() & grid['month'].isin(selected)]
+        by_unit = usable.groupby('unit')[['num', 'den']].sum().reindex(cascade.units)
+        np.testing.assert_allclose(cascade.unit_summary(name, lag, window, selected).to_numpy(),
+                                   ratio(by_unit['num'], by_unit['den']).to_numpy(), equal_nan=True)
+
+
+def test_gap_months_stay_on_the_axis(cube):
+    cascade = LaggedCascade(cube)
+    assert len(cascade.months) == 8
+    assert pd.Period('2024-04', freq='M') in cascade.months
+    name = 'EID Coverage'
+    # April has no data: its same-period ratio is unavailable and May's one-month lag sees nothing
+    assert np.isnan(cascade.national(name).loc['2024-04'])
+    assert np.isnan(cascade.national(name, lag=1).loc['2024-05'])
+
+
+def test_lag_zero_is_the_same_period_ratio(cube):
+    cascade = LaggedCascade(cube, 'orgunitlevel1')
+    monthly = cube[cube['periodname'] != 'Q1 2024'].groupby('periodname').sum(numeric_only=True)
+    for name, (numerator_cols, denominator_cols) in LAGGED_RATIOS.items():
+        expected = ratio(monthly[numerator_cols].sum(axis=1), monthly[denominator_cols].sum(axis=1))
+        expected.index = pd.PeriodIndex(pd.to_datetime(expected.index, format='%B %Y'), freq='M')
+        np.testing.assert_allclose(cascade.national(name, 0, 1).loc[expected.index].to_numpy(),
+                                   expected.to_numpy(), equal_nan=True)
+
+
+def test_no_calendar_months_is_empty(cube):
+    quarterly = cube.assign(periodname='Q1 2024')
+    assert LaggedCascade(quarterly).empty
+    assert LaggedCascade(cube.drop(columns='periodname')).empty
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pmtct_core import ResultCache, encode_filter_params, decode_filter_params, estimate_nbytes
+
+OPTIONS = {
+    'periodname': ['January 2024', 'February 2024', 'March 2024', 'April 2024'],
+    'orgunitlevel1': ['Kano', 'Lagos', 'Oyo'],
+    'orgunitlevel2': ['Dala', 'Ikeja'],
+}
+
+
+@pytest.mark.parametrize('selection', [
+    {'periodname': ['January 2024'], 'orgunitlevel1': ['Kano', 'Oyo']},
+    {'periodname': ['January 2024', 'February 2024', 'April 2024']},
+    {'orgunitlevel1': ['Lagos'], 'orgunitlevel2': ['Ikeja']},
+])
+def test_filter_params_round_trip(selection):
+    params = encode_filter_params(selection, OPTIONS)
+    decoded = decode_filter_params(params, OPTIONS)
+    for col, options in OPTIONS.items():
+        assert decoded[col] == (selection[col] if col in selection else None)
+
+
+def test_filters_keeping_most_options_list_the_dropped_ones():
+    params = encode_filter_params({'periodname': ['January 2024', 'February 2024', 'April 2024'],
+                                   'orgunitlevel1': OPTIONS['orgunitlevel1']}, OPTIONS)
+    assert params == {'not_period': ['March 2024']}
+
+
+def test_unknown_values_in_params_are_ignored():
+    decoded = decode_filter_params({'state': ['Kano', 'Atlantis'], 'not_period': ['May 2030']}, OPTIONS)
+    assert decoded['orgunitlevel1'] == ['Kano']
+    assert decoded['periodname'] == OPTIONS['periodname']
+    assert decoded['orgunitlevel2'] is None
+
+
+def test_estimate_counts_shared_objects_once():
+    frame = pd.DataFrame({'a': np.zeros(1000)})
+    assert estimate_nbytes(np.zeros(100)) == 800
+    assert estimate_nbytes({'x': frame, 'y': frame}) < 2 * frame.memory_usage(deep=True).sum()
+
+
+def test_lru_eviction_by_size():
+    cache = ResultCache(max_bytes=3000)
+    for key in 'abc':
+        cache.put(key, np.zeros(125))
+    assert cache.nbytes == 3000
+    
+    cache.get('a')
+    cache.put('d', np.zeros(125))
+    assert list(cache.entries) == ['c', 'a', 'd']
+    
+    cache.put('e', np.zeros(250))
+    assert list(cache.entries) == ['d', 'e']
+    assert cache.nbytes == 3000
+    
+    # Replacing a key releases its old size
+    cache.put('e', np.zeros(10))
+    assert cache.nbytes == 1080
+
+
+def test_results_over_budget_are_returned_but_not_kept():
+    cache = ResultCache(max_bytes=1000)
+    cache.put('small', np.zeros(10))
+    assert cache.get_or_compute('big', lambda: np.zeros(1000)).shape == (1000,)
+    assert 'big' not in cache.entries
+    assert 'small' in cache.entries
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResultCache()
+    calls = []
+    start = threading.Barrier(8)
+    
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'value'
+    
+    def request(results, i):
+        start.wait()
+        results[i] = cache.get_or_compute('key', compute)
+    
+    results = [None] * 8
+    threads = [threading.Thread(target=request, args=(results, i)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['value'] * 8
+    assert not cache.pending
+
+
+def test_failed_compute_reaches_waiters_and_is_retried():
+    cache = ResultCache()
+    
+    started = threading.Event()
+    
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError("boom")
+    
+    errors = []
+    
+    def wait():
+        started.wait()
+        try:
+            cache.get_or_compute('key', lambda: 'not called')
+        except RuntimeError as e:
+            errors.append(str(e))
+    
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('key', fail)
+    waiter.join()
+    assert errors == ["boom"]
+    assert not cache.pending
+    assert cache.get_or_compute('key', lambda: 1) == 1
@@ -0,0 +1,45 @@
+from pmtct_core import load_extract_bundle, directory_extract_sources, validate_schema
+
+ANC_2 = 'PMTCT_ANC_2. Number of new ANC Clients tested for syphilis total'
+ANC_3 = 'PMTCT_ANC_3. Number of new ANC Clients tested positive for syphilis Total'
+ANC_4 = 'PMTCT_ANC_4. Number of the ANC Clients treated for Syphilis total'
+
+
+def test_case_and_spacing_differences_are_renamed(synthetic_data):
+    sample = synthetic_data.rename(columns={ANC_2: '  ' + ANC_2.upper().replace(' ', '  ')})
+    report = validate_schema(sample)
+    assert ANC_2 in report.found
+    assert report.renames == {ANC_2: '  ' + ANC_2.upper().replace(' ', '  ')}
+    assert report.complete
+
+
+def test_one_column_is_suggested_for_one_missing_column(synthetic_data):
+    sample = synthetic_data.drop(columns=[ANC_2, ANC_4]).rename(
+        columns={ANC_3: 'PMTCT_ANC_3. No. of new ANC Clients tested positive for syphilis'})
+    report = validate_schema(sample)
+    
+    assert {ANC_2, ANC_3, ANC_4} <= set(report.missing)
+    assert report.suggestions == {ANC_3: 'PMTCT_ANC_3. No. of new ANC Clients tested positive for syphilis'}
+
+
+def test_each_column_goes_to_its_closest_missing_column(synthetic_data):
+    sample = synthetic_data.rename(columns={
+        ANC_2: 'PMTCT_ANC_2. No. of new ANC Clients tested for syphilis',
+        ANC_3: 'PMTCT_ANC_3. No. of new ANC Clients tested positive for syphilis',
+    })
+    report = validate_schema(sample)
+    assert report.suggestions == {
+        ANC_2: 'PMTCT_ANC_2. No. of new ANC Clients tested for syphilis',
+        ANC_3: 'PMTCT_ANC_3. No. of new ANC Clients tested positive for syphilis',
+    }
+
+
+def test_bundle_returns_the_report_with_its_renames(tmp_path, synthetic_data):
+    renamed = synthetic_data.rename(columns={ANC_2: ANC_2.lower()})
+    for state, extract in renamed.groupby('orgunitlevel1'):
+        extract.to_csv(tmp_path / f'{state}.csv', index=False)
+    
+    data, report = load_extract_bundle(directory_extract_sources(tmp_path))
+    assert report.renames == {ANC_2: ANC_2.lower()}
+    assert f"Using '{ANC_2.lower()}' for '{ANC_2}'" in report.messages()
+    assert ANC_2 in data.columns